@@ -0,0 +1,41 @@
+"""Memory used by the cache as a plain list of dicts vs a ResultCache.
+
+Run from the repository root: python -m benchmarks.cache_memory [records]
+With 50k records of the current synthetic data it measures 211.1 MiB for the list of dicts and 119.2 MiB for the
+ResultCache, 43.5% less. Re-run it after changing benchmarks/synthetic.py rather than trusting these figures.
+"""
+import json
+import sys
+import tracemalloc
+
+from src.resultcache import ResultCache
+from benchmarks.synthetic import generateRecords
+
+
+def records(n):
+    """n synthetic records, each decoded from its own JSON like items from a response,
+    so repeated strings are separate objects the way they are in a real query result."""
+    for record in generateRecords(n):
+        yield json.loads(json.dumps(record))
+
+
+def measure(build, n):
+    tracemalloc.start()
+    result = build(records(n))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(result) == n
+    return current
+
+
+def main(n):
+    listBytes = measure(list, n)
+    cacheBytes = measure(ResultCache, n)
+    print(f"{n} records")
+    print(f"list of dicts  {listBytes / 2**20:8.1f} MiB  {listBytes / n:6.0f} B/record")
+    print(f"ResultCache    {cacheBytes / 2**20:8.1f} MiB  {cacheBytes / n:6.0f} B/record")
+    print(f"saving         {1 - cacheBytes / listBytes:8.1%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,39 @@
+"""Per-item cost of turning a response's wire format items into records:
+the resource layer's TypeDeserializer followed by _normalise, vs the fast path's _fastItem.
+
+Run from the repository root: python -m benchmarks.deserialise [records]
+"""
+import sys
+import time
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from src.aevirepo import _fastItem, _normalise
+from benchmarks.synthetic import generateRecords
+
+
+def resourceItem(item, deserialise=TypeDeserializer().deserialize):
+    """What the resource layer does to every item, then what AeviRepo did on top of it."""
+    return _normalise({k: deserialise(v) for k, v in item.items()})
+
+
+def measure(convert, items):
+    started = time.perf_counter()
+    records = [convert(item) for item in items]
+    return records, time.perf_counter() - started
+
+
+def main(n):
+    serialise = TypeSerializer().serialize
+    items = [{k: serialise(v) for k, v in record.items()} for record in generateRecords(n)]
+    resourceRecords, resourceSeconds = measure(resourceItem, items)
+    fastRecords, fastSeconds = measure(_fastItem, items)
+    assert fastRecords == resourceRecords
+    print(f"{n} records")
+    print(f"resource layer  {resourceSeconds / n * 1e6:8.2f} us/item")
+    print(f"fast path       {fastSeconds / n * 1e6:8.2f} us/item")
+    print(f"speedup         {resourceSeconds / fastSeconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,171 @@
+"""Benchmark AeviRepo's query, cache and save/load paths against a table of synthetic transactions.
+
+Run from the repository root:
+    python -m benchmarks.run --sizes 10000 100000 --output benchmarks/results/latest.json
+    python -m benchmarks.run --sizes 10000 --compare benchmarks/results/latest.json
+The table lives in moto unless --local is given, in which case it is created in localstack.
+Every benchmark is timed once, then run again under tracemalloc for its peak memory (skip with --no-memory).
+Results are written as JSON, tagged with the git commit, so runs from different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime as dt
+
+import src.aevirepo as aevi
+from src.resultfile import readRecords, writeRecords
+from src.resultstore import ResultStore
+from benchmarks.synthetic import STATUSES, createTable, generateRecords, loadTable
+
+TABLE = "bench-aevi-Transaction"
+LOOKUPS = 1000  # Ids fetched by the id lookup benchmark
+FILES = 10  # Files fetched by the filename lookup benchmark
+
+
+def benchmarks(repo, fastRepo, records, tmp):
+    """(name, function) pairs, fastRepo being the same table through the low-level client fast path.
+    Each function runs the benchmark once and returns the number of records it handled
+    (for the cache filters, the number of records filtered)."""
+    ids = [r["id"] for r in records[:LOOKUPS]]
+    filenames = list(dict.fromkeys(r["transaction_filename_id"] for r in records))[:FILES]
+    merchant = records[0]["host_merchant_id"]
+    paths = {fmt: os.path.join(tmp, f"results.{fmt}") for fmt in ("json", "ndjson.gz", "db")}
+
+    def filterCache():
+        repo.setCache(records)
+        repo.filterCache({"host_merchant_id": f"= {merchant}", "timestamp": "> 1634000000"})
+        return len(records)
+
+    def filterCacheRepeated():
+        repo.filterCache({"host_merchant_id": f"= {merchant}"})
+        repo.filterCache({"status": "= FAILED", "mainamount": "> 250"})
+        return len(records)
+
+    def saveJson():
+        with open(paths["json"], "w") as fp:
+            json.dump(records, fp)
+        return len(records)
+
+    def saveStore():
+        return ResultStore.create(paths["db"]).insert(records)
+
+    return [
+        ("status_query", lambda: len(repo.runStatusQuery(["FAILED"]))),
+        ("status_query_fast", lambda: len(fastRepo.runStatusQuery(["FAILED"]))),
+        ("status_query_concurrent", lambda: len(repo.runStatusQuery(list(STATUSES), concurrent=True))),
+        ("status_query_projected", lambda: len(repo.runStatusQuery(list(STATUSES), concurrent=True,
+                                                                   projection=["errorcode", "timestamp"]))),
+        ("filtered_status_query", lambda: sum(1 for i in repo.runFilteredStatusQuery(["FAILED"], "errorcode = 70000", limit=100)
+                                              if i != "PAGE_END")),
+        ("count_query", lambda: repo.countStatusQuery(list(STATUSES))["Count"]),
+        ("filter_cache", filterCache),
+        ("filter_cache_repeated", filterCacheRepeated),
+        ("group_cache", lambda: sum(g.count for g in repo.aggregateCache("host_merchant_id").values())),
+        ("group_status_query", lambda: sum(g.count for g in repo.aggregateStatusQuery(list(STATUSES), "currencyiso3a").values())),
+        ("id_lookup", lambda: sum(1 for _ in repo.runBulkIdQuery(ids))),
+        ("filename_lookup", lambda: sum(1 for _ in repo.runFilenamesQuery(filenames))),
+        ("save_json", saveJson),
+        ("load_json", lambda: len(json.load(open(paths["json"])))),
+        ("save_ndjson_gz", lambda: writeRecords(paths["ndjson.gz"], records)),
+        ("load_ndjson_gz", lambda: sum(1 for _ in readRecords(paths["ndjson.gz"]))),
+        ("save_sqlite", saveStore),
+        ("load_sqlite", lambda: len(ResultStore.load(paths["db"]))),
+    ]
+
+
+def measure(function, memory=True):
+    started = time.perf_counter()
+    count = function()
+    seconds = time.perf_counter() - started
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return {"seconds": round(seconds, 6), "records": count, "recordsPerSecond": round(count / seconds if seconds else 0, 1),
+            "peakMiB": None if peak is None else round(peak, 2)}
+
+
+def runSize(size, local, memory, only):
+    """Load a fresh table of size records and run every benchmark against it."""
+    repo = aevi.AeviRepo(local)
+    if TABLE in [t.name for t in repo._conn.tables.all()]:
+        repo._conn.Table(TABLE).delete()
+    print(f"Loading {size} records... ", end="", flush=True)
+    records = list(generateRecords(size))
+    loadTable(createTable(repo._conn, TABLE), records)
+    repo.setTable(TABLE)
+    fastRepo = aevi.AeviRepo(local, fastPath=True)
+    fastRepo.setTable(TABLE)
+    print("done")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, function in benchmarks(repo, fastRepo, records, tmp):
+            if only and name not in only:
+                continue
+            result = dict(name=name, size=size, **measure(function, memory))
+            print(f"  {name.ljust(26)}{result['seconds']:10.3f} s {result['recordsPerSecond']:12.0f} records/s"
+                  + (f" {result['peakMiB']:10.1f} MiB" if memory else ""))
+            results.append(result)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    """Print the time of each benchmark relative to a previous run."""
+    baseline = {(r["name"], r["size"]): r for r in json.load(open(path))["results"]}
+    print(f"\nCompared to {path} (>1 is slower):")
+    for result in results:
+        old = baseline.get((result["name"], result["size"]))
+        if old and old["seconds"]:
+            print(f"  {result['name'].ljust(26)}{result['size']:>9} {result['seconds'] / old['seconds']:8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000], help="table sizes to benchmark")
+    parser.add_argument("--output", default="benchmarks/results/latest.json", help="where to write the results")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    parser.add_argument("--local", action="store_true", help="use localstack instead of moto")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc runs")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        if args.local:
+            results += runSize(size, True, args.memory, args.only)
+        else:
+            from moto import mock_dynamodb2
+            with mock_dynamodb2():
+                results += runSize(size, False, args.memory, args.only)
+    report = {
+        "commit": commit(),
+        "created": dt.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": "localstack" if args.local else "moto",
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as fp:
+        json.dump(report, fp, indent=2)
+    print(f"\nWritten to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+"""Cold start of the CLI and GUI: how long importing them takes, and how long until the menu (or window) is up.
+
+Run from the repository root: python -m benchmarks.startup [runs]
+Every measurement is a fresh interpreter started in src/, the way main.py runs, and the median of the runs is shown.
+"python" is an interpreter that imports nothing, the floor the others start from.
+The GUI is skipped when PySide6 is not installed. No AWS credentials are needed, since nothing should connect.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Each prints the seconds from its first line to the point measured
+SCRIPTS = {
+    "python": "import time; t = time.perf_counter(); print(time.perf_counter() - t)",
+    "cli import": "import time; t = time.perf_counter(); import cli; print(time.perf_counter() - t)",
+    "cli menu": """
+import sys, time
+t = time.perf_counter()
+import cli
+def read():
+    sys.stderr.write(f"{time.perf_counter() - t}\\n")
+    return "q"
+cli.read = read
+cli.run(False)
+""",
+    "gui import": "import time; t = time.perf_counter(); import gui; print(time.perf_counter() - t)",
+    "gui window": """
+import time
+t = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+from aevirepo import AeviRepo
+from view.aeviquerywindow import AeviQueryWindow
+app = QApplication([])
+repo = AeviRepo(False)
+repo.setTable("prod-aevi-Transaction")
+window = AeviQueryWindow(repo)
+app.processEvents()
+print(time.perf_counter() - t)
+""",
+}
+
+
+def measure(script):
+    """(seconds the script reports, wall seconds including interpreter startup)"""
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    started = time.perf_counter()
+    res = subprocess.run([sys.executable, "-c", script], cwd=SRC, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().splitlines()[-1])
+    reported = (res.stderr if "cli.run" in script else res.stdout).strip().splitlines()[-1]
+    return float(reported), wall
+
+
+def main(runs):
+    try:
+        import PySide6  # noqa: F401
+        gui = True
+    except ImportError:
+        gui = False
+    print(f"{'':<14}{'measured':>12}{'wall':>12}   (median of {runs} runs)")
+    for name, script in SCRIPTS.items():
+        if name.startswith("gui") and not gui:
+            print(f"{name:<14}{'skipped, PySide6 is not installed':>40}")
+            continue
+        results = [measure(script) for _ in range(runs)]
+        print(f"{name:<14}{statistics.median(r[0] for r in results) * 1000:10.1f} ms"
+              f"{statistics.median(r[1] for r in results) * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
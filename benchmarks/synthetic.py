@@ -0,0 +1,127 @@
+"""Synthetic transactions shaped like the real prod-aevi-Transaction items, for benchmarks."""
+import json
+import random
+import uuid
+
+STATUSES = {"FAILED": 0.55, "SUCCESS": 0.30, "PENDING": 0.08, "RETRY": 0.05, "ARCHIVED": 0.02}
+ERRORS = [("30000", "Invalid field"), ("70000", "Decline"), ("60010", "Bank system error"), ("0", "Ok")]
+START = 1633000000  # 2021-09-30
+SPREAD = 60 * 60 * 24 * 45  # Seconds the timestamps are spread over
+RECORDS_PER_FILE = 1000
+CARDS = ["VISA", "MASTERCARD", "MAESTRO", "AMEX"]
+
+
+def generateRecords(n, seed=0, statuses=STATUSES, start=START, spread=SPREAD):
+    """Yields n reproducible records. Statuses follow the weights given, timestamps are uniform over the spread,
+    and st_request is a JSON string with the full set of fields, so items are the size of the real ones."""
+    rand = random.Random(seed)
+    names, weights = list(statuses), list(statuses.values())
+    merchants = [f"0001049600{m:05d}" for m in range(500)]
+    for i in range(n):
+        status = rand.choices(names, weights)[0]
+        errorcode, errormessage = rand.choice(ERRORS)
+        merchant = rand.choice(merchants)
+        timestamp = start + rand.randrange(spread)
+        guid = str(uuid.UUID(int=rand.getrandbits(128))).upper()
+        filename = str(uuid.UUID(int=i // RECORDS_PER_FILE + (seed << 64)))
+        request = {
+            "requesttypedescription": "AUTH",
+            "accounttypedescription": "POS",
+            "acquirertransactionid": str(rand.randrange(10**11)),
+            "acquirertransactionreference": str(rand.randrange(10**10)),
+            "acquirerresponsecode": "00",
+            "acquirerguid": str(uuid.UUID(int=rand.getrandbits(128))).upper(),
+            "retrievalreferencenumber": str(rand.randrange(10**12)),
+            "terminalid": f"T{rand.randrange(10**7):07d}",
+            "authcode": f"{rand.randrange(10**6):06d}",
+            "stan": str(rand.randrange(10**4)),
+            "deviceprocessingmode": "Online",
+            "mainamount": f"{rand.randrange(100, 50000) / 100:.2f}",
+            "currencyiso3a": rand.choice(["EUR", "GBP"]),
+            "errorcode": "0",
+            "transactionstartedtimestamp": "2021-08-11 12:08:20",
+            "maskedpan": f"{rand.randrange(400000, 560000)}******{rand.randrange(10**4):04d}",
+            "paymenttypedescription": rand.choice(CARDS),
+            "cardentrymode": rand.choice(["ChipContactless", "Chip", "Swipe"]),
+            "cardholderverificationmethod": "None",
+            "issuer": "",
+            "stationname": "merchant name",
+            "stationbusinessid": "merchant name",
+            "stationid": str(rand.randrange(10**10)),
+            "stationoriginalid": str(rand.randrange(10**5)),
+            "stationstreet": "",
+            "stationpremise": "",
+            "stationtown": "",
+            "stationpostcode": "",
+            "stationcountryiso2a": "",
+            "deviceid": str(rand.randrange(10**10)),
+            "deviceconfigurationversion": "",
+            "devicesoftwareversion": "0401.132095",
+            "merchantcategorycode": "5411",
+            "deviceattended": "",
+            "devicecategory": "EFTPOSTerminal",
+            "devicetype": "IndoorPaymentTerminal",
+            "devicemodel": "CastlesHW_V3C",
+            "devicevendor": "",
+            "customfield1": f"aevi-listener-{rand.getrandbits(160):040x}",
+            "dcctype": "DCC",
+            "dccoffered": "2",
+            "dccprovider": "FEXCO",
+            "dcccurrencyiso3a": "EUR",
+            "dccmainamount": "18.25",
+            "sitereference": f"siteref{rand.randrange(10**5):05d}",
+        }
+        yield {
+            "business_transaction_id": str(rand.randrange(10**11)),
+            "created_at": timestamp - rand.randrange(60 * 60 * 24 * 90),
+            "errorcode": errorcode,
+            "errormessage": errormessage,
+            "expected_error_code": "0",
+            "expiration_month": "TRUNCATED",
+            "guid": guid,
+            "host_device_id": request["terminalid"],
+            "host_merchant_id": merchant,
+            "id": f"{rand.getrandbits(256):064x}",
+            "key_business_transaction_id": f"{merchant}AuthorisationPurchase{rand.randrange(10**11)}",
+            "key_guid": f"{merchant}AuthorisationPurchase{guid}",
+            "requestreference": f"Ab{rand.randrange(10**6)}",
+            "send_attempts": rand.randrange(1, 4),
+            "st_request": json.dumps(request),
+            "status": status,
+            "timestamp": timestamp,
+            "transaction_filename_id": filename,
+            "transaction_request_filename": filename,
+            "transaction_request_id": f"{filename}:{i % RECORDS_PER_FILE}",
+            "version": rand.randrange(1, 10),
+        }
+
+
+def createTable(conn, tableName="prod-aevi-Transaction"):
+    """Create a table with the same key schema and indexes as the real one."""
+    index = lambda name: {
+        "IndexName": name,
+        "KeySchema": [{"AttributeName": name, "KeyType": "HASH"}],
+        "Projection": {"ProjectionType": "ALL"},
+        "ProvisionedThroughput": {"ReadCapacityUnits": 1, "WriteCapacityUnits": 1},
+    }
+    return conn.create_table(
+        TableName=tableName,
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "status", "AttributeType": "S"},
+            {"AttributeName": "transaction_filename_id", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[index("status"), index("transaction_filename_id")],
+        ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+    )
+
+
+def loadTable(table, records) -> int:
+    """Write records into a table in batches. Returns how many were written."""
+    count = 0
+    with table.batch_writer() as batch:
+        for record in records:
+            batch.put_item(Item=record)
+            count += 1
+    return count
@@ -1,14 +1,57 @@
 from decimal import Decimal
-import localstack_client.session as boto3_local  # todo: this is only for connecting to localstack
-import boto3
 import json
-from boto3.dynamodb.conditions import Attr, Key
-from functools import reduce
+from functools import reduce, partial
+from collections import Counter
+import queue
+import random
+import threading
+import time
 import re
 from datetime import datetime as dt
 
 from botocore.exceptions import ClientError
 
+try:
+    from .resultcache import ResultCache
+    from .resultstore import ResultStore
+    from .resultfile import writeRecord
+    from .ratelimiter import RateLimiter
+    from .querystats import QueryStats
+    from .querycache import MAX_BYTES, QueryCache, recordSize
+    from .predicates import Predicate, toNumber
+    from .planner import Plan, planQuery
+    from .aggregate import aggregate
+    from .checkpoint import Checkpoint
+except ImportError:  # Run as a script from src/
+    from resultcache import ResultCache
+    from resultstore import ResultStore
+    from resultfile import writeRecord
+    from ratelimiter import RateLimiter
+    from querystats import QueryStats
+    from querycache import MAX_BYTES, QueryCache, recordSize
+    from predicates import Predicate, toNumber
+    from planner import Plan, planQuery
+    from aggregate import aggregate
+    from checkpoint import Checkpoint
+
+MAX_WORKERS = 8  # Concurrent queries in flight, also sizes the connection pool
+REGION = "eu-west-1"  # Default AWS region of the table
+QUEUE_SIZE = 1000  # Items buffered between the query workers and the consumer
+ORDERINGS = ("interleaved", "grouped")
+BATCH_GET_SIZE = 100  # Most keys DynamoDB accepts in one BatchGetItem
+MAX_RETRIES = 8  # Attempts at unprocessed keys before giving up
+RETRY_BASE = 0.05  # Seconds, doubled on each retry
+RETRY_CAP = 5  # Most seconds to wait between retries
+MAX_TIMESTAMP = 2**63 - 1  # Open upper end of a timestamp range
+# Attributes of the items themselves, any other attribute in a filter string is a field of st_request
+TOP_LEVEL_ATTRS = {
+    "business_transaction_id", "created_at", "errorcode", "errormessage", "expected_error_code", "expiration_month",
+    "guid", "host_device_id", "host_merchant_id", "id", "key_business_transaction_id", "key_guid", "requestreference",
+    "send_attempts", "st_request", "status", "timestamp", "transaction_filename_id", "transaction_request_filename",
+    "transaction_request_id", "version",
+}
+THROTTLE_ERRORS = ("ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded")
+
 class EmptyCacheError(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
@@ -16,61 +59,304 @@ class EmptyCacheError(Exception):
 
 class AeviRepo():
     """Query the DynamoDB database. Requires the current shell to be signed in to AWS."""
-    def __init__(self, local: bool):
+    def __init__(self, local: bool, maxWorkers: int = MAX_WORKERS, fastPath: bool = False, region: str = REGION):
         self.isLocal = local
+        self.region = region
         if local:
             print("Running locally")
         else:
             print("Not running locally")
-        boto = boto3_local if self.isLocal else boto3
-        self._conn = boto.resource("dynamodb", region_name="eu-west-1")
-        self._table: boto.dynamodb.Table = None
-        self._cache = []
+        self.maxWorkers = maxWorkers
+        # Every request goes through the low-level client, see _clientCall. The fast path deserialises items itself
+        # instead of with boto3's TypeDeserializer, see _fastItem
+        self.fastPath = fastPath
+        self._normalise = _fastPath if fastPath else _normalise
+        # Nothing connects to DynamoDB until the first query, see _client
+        self._tableName = None
+        self._tableResource = None
+        self._clientConnection = None
+        self._description = None
+        self._cache = ResultCache()
+        self._cacheQuery = None
+        self._indexKeys = {}
+        self._limiter = None
+        self._queryCache = None
+        self._hooks = []
+        self.lastStats: QueryStats = None
 
     def setTable(self, tableName):
-        """Connect to the specified table."""
-        self._table = self._conn.Table(tableName)
+        """Connect to the specified table (when it is first queried)."""
+        self._tableName = tableName
+        self._tableResource = None
+        self._clientConnection = None
+        self._description = None
+        self._indexKeys = {}
 
-    def runStatusQuery(self, statuses: list) -> list:
-        """Returns a list of records matching the query"""
-        res = []
+    @property
+    def _conn(self):
+        """The DynamoDB resource, shared with every AeviRepo of the same table and settings, see _connect."""
+        return _connect("resource", self.isLocal, self.maxWorkers, self.region, self._tableName)
+
+    @property
+    def _client(self):
+        """The low-level client every request is made with. Unlike the resource it is thread-safe,
+        so the query workers can share it."""
+        if self._clientConnection is None:
+            self._clientConnection = _connect("client", self.isLocal, self.maxWorkers, self.region, self._tableName)
+        return self._clientConnection
+
+    @_client.setter
+    def _client(self, client):
+        self._clientConnection = client
+
+    @property
+    def _table(self):
+        """The Table resource, for setting tables up. Queries never use it, see _client."""
+        if self._tableResource is None and self._tableName is not None:
+            self._tableResource = self._conn.Table(self._tableName)
+        return self._tableResource
+
+    @_table.setter
+    def _table(self, table):
+        self._tableResource = table
+
+    def setRateLimit(self, rcuPerSecond=None):
+        """Cap the read capacity used by all queries together, e.g. while the live pipeline shares the table.
+        None removes the cap."""
+        self._limiter = RateLimiter(rcuPerSecond) if rcuPerSecond else None
+
+    def getRateLimiter(self):
+        return self._limiter
+
+    def setQueryCache(self, ttl=None, maxBytes=MAX_BYTES, spillDir=None):
+        """Memoise the results of status queries for ttl seconds, see QueryCache. None turns memoisation off.
+        This sits alongside the working set cache of setCache, which it never touches."""
+        self._queryCache = QueryCache(ttl, maxBytes, spillDir) if ttl else None
+
+    def getQueryCache(self):
+        return self._queryCache
+
+    def addHook(self, hook):
+        """Call hook(operation, kwargs, response, seconds) after every request a query makes."""
+        self._hooks.append(hook)
+
+    def removeHook(self, hook):
+        self._hooks.remove(hook)
+
+    def runStatusQuery(self, statuses: list, concurrent=False, ordering="grouped", partitions=1, projection=None) -> list:
+        """Returns a list of records matching the query. 
+        With concurrent=True the statuses are queried in parallel, see streamStatusQuery.
+        projection is an optional list of attributes to fetch, as for every query method. id (and the key of the index
+        queried) are always fetched, so a record can be completed later."""
+        if ordering not in ORDERINGS:
+            raise ValueError(f"ordering must be one of {ORDERINGS}")
+        self._beginStats(f"status {','.join(statuses)}")
+        if concurrent:
+            items = self._streamStatus(statuses, None, ordering, partitions, projection)
+        else:
+            items = (item for status in statuses for item in self._queryStatus(status, projection=projection))
+        return list(self._memoised(self._key("status", "status", statuses, None, projection), items))
+
+    def streamStatusQuery(self, statuses: list, filterString=None, ordering="interleaved", partitions=1, projection=None):
+        """Yields records for all statuses, running one paginated query per status on a bounded thread pool.
+        ordering is "interleaved" (records as they arrive) or "grouped" (all of the first status, then the next...).
+        partitions splits a status (an int for every status, or a dict of status: int) into that many sort key 
+        ranges queried in parallel. Only possible when the status index has a sort key.
+        Never memoised, so streaming a result into a file, store or aggregate never holds it in memory."""
+        if ordering not in ORDERINGS:
+            raise ValueError(f"ordering must be one of {ORDERINGS}")
+        self._beginStats(f"status {','.join(statuses)}" + (f" filtered by {filterString}" if filterString else ""))
+        yield from self._streamStatus(statuses, filterString, ordering, partitions, projection)
+
+    def countStatusQuery(self, statuses: list, filterString=None) -> dict:
+        """Counts the records matching the query without transferring them (Select=COUNT), 
+        querying the statuses concurrently. The exception is a filter on st_request fields, which DynamoDB can't
+        evaluate: then the st_request of every item that passes the rest of the filter is downloaded and checked here.
+        Returns the totals and a breakdown per status, e.g.
+        {"Count": 3, "ScannedCount": 5, "statuses": {"FAILED": {"Count": 3, "ScannedCount": 5}}}"""
+        self._beginStats(f"count {','.join(statuses)}" + (f" filtered by {filterString}" if filterString else ""))
+        key = self._key("count", "status", statuses, filterString)
+        counts = self._queryCache.get(key) if self._queryCache is not None else None
+        if counts is not None:
+            return counts
+        counts = {"Count": 0, "ScannedCount": 0, "statuses": {}}
         for status in statuses:
-            for item in self._queryStatus(status):
-                res.append(item)
-        return res
+            counts["statuses"][status] = {"Count": 0, "ScannedCount": 0}
+        jobs = [(status, partial(self._countStatus, status, filterString)) for status in statuses]
+        for status, count, scannedCount in _merge(jobs, self.maxWorkers):
+            counts["statuses"][status]["Count"] += count
+            counts["statuses"][status]["ScannedCount"] += scannedCount
+            counts["Count"] += count
+            counts["ScannedCount"] += scannedCount
+        if self._queryCache is not None:
+            self._queryCache.put(key, counts)
+        return counts
 
-    def runFilteredStatusQuery(self, statuses: list, filterString=None) -> dict:
+    def runFilteredStatusQuery(self, statuses: list, filterString=None, limit=1, pageSize=None, prefetch=0, projection=None) -> dict:
         """Yields a page of results matching the query. 
-        PAGE_END is yielded at the end of a page to check for continuation."""
-        for status in statuses:
-            for item in self._queryStatus(status, filterString):
+        PAGE_END is yielded at the end of a page to check for continuation.
+        limit is the number of items DynamoDB evaluates per request. pageSize is the number of matching records
+        per yielded page, if None a page is whatever one request returned. prefetch fetches up to that many 
+        requests ahead in a background thread while the current page is being read.
+        With a query cache set, a query read to the end is memoised (page markers included) unless it is too big to keep."""
+        self._beginStats(f"status {','.join(statuses)}" + (f" filtered by {filterString}" if filterString else ""))
+        key = self._key("filtered", "status", statuses, filterString, projection, limit=limit, pageSize=pageSize)
+        yield from self._memoised(key, self._filteredStatus(statuses, filterString, limit, pageSize, prefetch, projection))
+
+    def streamScan(self, filterString=None, projection=None, segments=None):
+        """Yields every record in the table (matching the filter string if given) using a parallel scan,
+        one worker per segment. projection is an optional list of attribute names to fetch."""
+        segments = segments or self.maxWorkers
+        self._beginStats("scan" + (f" filtered by {filterString}" if filterString else ""))
+        jobs = [(segment, partial(self._scanSegment, segment, segments, filterString, projection)) 
+                for segment in range(segments)]
+        yield from _merge(jobs, self.maxWorkers)
+
+    def runScan(self, sink, filterString=None, projection=None, segments=None) -> int:
+        """Scan the whole table into a sink without holding it in memory. sink is either a callable taking 
+        each record, or a writable file that records are written to as newline delimited JSON.
+        Returns the number of records scanned."""
+        if hasattr(sink, "write"):
+            sink = partial(writeRecord, sink)
+        count = 0
+        for item in self.streamScan(filterString, projection, segments):
+            sink(item)
+            count += 1
+        return count
+
+    def explainQuery(self, filterString) -> str:
+        """How runPlannedQuery would run a filter string, and its estimated read cost against the alternatives."""
+        return self._plan(filterString).explain()
+
+    def runPlannedQuery(self, filterString, projection=None, segments=None):
+        """Yields the records matching a filter string, read whichever way the planner estimates is cheapest:
+        by id, through the filename or status index (with a time range as a key condition if the index is sorted
+        by timestamp), or with a parallel scan of segments segments. See planner for what can be planned."""
+        plan = self._plan(filterString)
+        self._beginStats(plan.describe() + (f" filtered by {plan.filterString}" if plan.filterString else ""))
+        if projection:
+            projection = list(dict.fromkeys(list(projection) + list(plan.memberships)))
+        if plan.access == "scan":
+            segments = segments or self.maxWorkers
+            jobs = [(segment, partial(self._scanSegment, segment, segments, plan.filterString or None, projection))
+                    for segment in range(segments)]
+        else:
+            jobs = [(key, partial(self._plannedQuery, plan, key, projection)) for key in plan.keys]
+        for item in _merge(jobs, self.maxWorkers):
+            if all(item.get(attr) in values for attr, values in plan.memberships.items()):
                 yield item
 
-    def setCache(self, results):
-        self._cache = results
+    def checkpointStatusQuery(self, statuses: list, path, filterString=None, projection=None):
+        """Yields the records of a status query like streamStatusQuery, saving every page to a checkpoint at path
+        (a .ndjson file, see Checkpoint) before yielding it. If the query stops partway, resumeStatusQuery(path)
+        carries on from the last page saved. Never memoised, and filtered pages are not limited to one item."""
+        checkpoint = Checkpoint.create(path, self._tableName, statuses, filterString, projection)
+        self._beginStats(f"status {','.join(statuses)}" + (f" filtered by {filterString}" if filterString else ""))
+        yield from self._checkpointed(checkpoint)
+
+    def resumeStatusQuery(self, path):
+        """Carry on with the checkpointed status query at path from the last page each status saved.
+        Yields only the records fetched now, skipping any already in the checkpoint; once it has finished,
+        readRecords(path) is the whole result. A finished checkpoint yields nothing."""
+        checkpoint = Checkpoint.load(path)
+        if checkpoint.table != self._tableName:
+            raise ValueError(f"{path} is a query of {checkpoint.table}, not {self._tableName}")
+        self._beginStats(f"resume {','.join(checkpoint.pending())}")
+        yield from self._checkpointed(checkpoint, checkpoint.ids())
+
+    def storeStatusQuery(self, store: ResultStore, statuses: list, filterString=None, projection=None) -> int:
+        """Stream the records matching the query into a ResultStore in batches, without holding them in memory.
+        Returns the number of records stored."""
+        return store.insert(self.streamStatusQuery(statuses, filterString, projection=projection))
+
+    def setCache(self, results, projection=None, statuses=None):
+        """Cache a query result. A ResultCache or ResultStore is used as is, anything else is copied into a ResultCache.
+        results can be any iterable, e.g. a query generator or resultfile.readRecords, which is read in one pass.
+        projection is the attributes the results were fetched with, the rest are fetched by id when needed
+        (without starting new stats, so lastStats still describes the query).
+        statuses is the statuses queried for the results, if given the cache can be brought up to date with refreshCache."""
+        self._cacheQuery = (list(statuses), projection) if statuses else None
+        if isinstance(results, (ResultCache, ResultStore)):
+            self._cache = results
+        else:
+            self._cache = ResultCache(results, projection, self._bulkGet if projection else None)
 
     def getCache(self):
         return self._cache
 
-    def filterCache(self, filterDict):  #TODO improve (contains, between, =, <, >, <=, >= etc.)
+    def refreshCache(self, recheck=False) -> dict:
+        """Bring a cached status query (see setCache) up to date without running it again. Only the records with a
+        timestamp at or after the newest one cached are fetched: with a key condition when the status index is sorted
+        by timestamp, otherwise with a filter, which still reads the partition but transfers only the new records.
+        They are merged in by id, keeping the highest version.
+        A record can change status without a newer timestamp, and then never shows up in that fetch, so nothing is
+        ever dropped unless recheck is set. recheck also fetches the status and version of every cached record
+        (with BatchGetItem) and drops those that no longer have one of the statuses, or have been deleted.
+        BatchGetItem is charged for the whole item whatever the projection, so a recheck costs about as much read
+        capacity as running the query again; it saves on transfer, not on capacity.
+        Returns how many records were added, updated and dropped, e.g. {"added": 2, "updated": 1, "dropped": 0}"""
+        if self._cacheQuery is None:
+            raise ValueError("The cache is not the result of a status query")
+        if not isinstance(self._cache, ResultCache):
+            raise TypeError("Only an in memory cache can be refreshed")
+        statuses, projection = self._cacheQuery
+        since = self._cache.max("timestamp")
+        if since is None:
+            raise ValueError("The cached records have no timestamp to refresh from")
+        self._beginStats(f"refresh status {','.join(statuses)} since {since}")
+        jobs = [(status, partial(self._queryStatusSince, status, since, projection)) for status in statuses]
+        fresh = {}
+        for item in _merge(jobs, self.maxWorkers):
+            if item.get("version", 0) >= fresh.get(item["id"], {}).get("version", 0):
+                fresh[item["id"]] = item
+        live = None
+        if recheck:
+            live = {item["id"]: item for item in self._bulkGet((r["id"] for r in self._cache), ["status", "version"])}
+        wanted = {status.strip() for status in statuses}
+        counts = {"added": 0, "updated": 0, "dropped": 0}
+        records = []
+        for record in self._cache:
+            new = fresh.pop(record["id"], None)
+            if new is not None and new.get("version", 0) >= record.get("version", 0):
+                counts["updated"] += new.get("version", 0) > record.get("version", 0)
+                record = new
+            current = live.get(record["id"]) if live is not None else record
+            if current is None or current.get("status") not in wanted:
+                counts["dropped"] += 1
+                continue
+            records.append(record)
+        counts["added"] = len(fresh)
+        records.extend(fresh.values())
+        self._cache = ResultCache(records, projection, self._bulkGet if projection else None)
+        return counts
+
+    def filterCache(self, filterDict):
+        """Filter the cached records, see ResultCache.filter. Raises ValueError for a non-numeric value on a numeric attribute."""
         if type(filterDict) != dict:
             raise TypeError()
         if len(self._cache) == 0:
             raise EmptyCacheError()
-        res = []
-        for item in self._cache:
-            st_request = json.loads(item["st_request"])
-            match = True
-            for k, v in filterDict.items():
-                if (str(v) not in str(item.get(k, None)) 
-                and str(v) not in str(st_request.get(k, None))):
-                    match = False
-                    break
-            if match:
-                res.append(item)
-        return res
+        return self._cache.filter(filterDict)
+
+    def aggregateCache(self, by, filterDict=None) -> dict:
+        """Group the cached records (those matching filterDict, if given) by the attribute by, see aggregate.
+        Returns {value: Group} with each group's count, first and last timestamp and total mainamount."""
+        if len(self._cache) == 0:
+            raise EmptyCacheError()
+        if filterDict:
+            return aggregate(self.filterCache(filterDict), by)
+        if isinstance(self._cache, ResultCache):
+            return self._cache.aggregate(by)
+        return aggregate(self._cache, by)
+
+    def aggregateStatusQuery(self, statuses: list, by, filterString=None) -> dict:
+        """Group the records of a status query by the attribute by as they arrive, without keeping them, see aggregate.
+        Only by, timestamp and st_request are fetched."""
+        projection = ["timestamp", "st_request"] + ([by] if by in TOP_LEVEL_ATTRS else [])
+        return aggregate(self.streamStatusQuery(statuses, filterString, projection=projection), by)
 
-    def runIdQuery(self, id):
+    def runIdQuery(self, id, projection=None):
+        self._beginStats(f"id {id.strip()}")
         kwargs = {
             "ExpressionAttributeNames": {
                 "#id": "id"
@@ -80,29 +366,180 @@ class AeviRepo():
             },
             "KeyConditionExpression": "#id = :x",
         }
-        res = self._table.query(**kwargs)
-        return res["Items"]
+        if projection:
+            _addProjection(kwargs, projection)
+        res = self._call("query", kwargs)
+        return [self._normalise(item) for item in res["Items"]]
 
-    def runFilenameQuery(self, filename):
-        kwargs = {
-            "IndexName": "transaction_filename_id",
-            "ExpressionAttributeNames": {
-                "#x": "transaction_filename_id"
-            },
-            "ExpressionAttributeValues": {
-                ":y": filename.strip()
-            },
-            "KeyConditionExpression": "#x = :y"
-        }
-        res = self._table.query(**kwargs)
-        return res["Items"]
+    def runBulkIdQuery(self, ids, projection=None):
+        """Yields the records for many ids, fetched with concurrent BatchGetItem calls of up to 100 ids each.
+        Unprocessed keys are retried with exponential backoff. Records come back in no particular order."""
+        ids = list(dict.fromkeys(id.strip() for id in ids if id.strip()))
+        self._beginStats(f"{len(ids)} ids")
+        yield from self._bulkGet(ids, projection)
+
+    def runFilenameQuery(self, filename, projection=None):
+        """Returns every record in a file, following pagination past the 1 MB page limit."""
+        self._beginStats(f"filename {filename.strip()}")
+        return [item for _, item in self._queryFilename(filename, projection)]
+
+    def runFilenamesQuery(self, filenames, counts=None, projection=None):
+        """Yields the records in many files, querying the files concurrently. 
+        If counts is a dict it is filled with the number of records found per filename, so incomplete files stand out."""
+        filenames = list(dict.fromkeys(f.strip() for f in filenames if f.strip()))
+        self._beginStats(f"{len(filenames)} filenames")
+        if counts is None:
+            counts = {}
+        for filename in filenames:
+            counts[filename] = 0
+        jobs = [(filename, partial(self._queryFilename, filename, projection)) for filename in filenames]
+        for filename, item in _merge(jobs, self.maxWorkers):
+            counts[filename] += 1
+            yield item
     
 
     # Private Methods ---------------------------------------------------------------
-    def _queryStatus(self, status, filterString=None):
-        """Query the current table with the specified status as index."""
-        done = False
-        startKey = None
+    def _key(self, *args, **options):
+        """QueryCache.key of a query of the current table."""
+        return QueryCache.key(*args, table=self._tableName, **options)
+
+    def _memoised(self, key, results):
+        """Yields the memoised results of the query key if there are any, otherwise the results given,
+        memoising them once they have all been read. Buffering stops as soon as they are too big to memoise."""
+        cached = self._queryCache.get(key) if self._queryCache is not None else None
+        if cached is not None:
+            yield from cached
+            return
+        if self._queryCache is None:
+            yield from results
+            return
+        res = []
+        size = 0
+        for item in results:
+            if res is not None:
+                res.append(item)
+                size += recordSize(item)
+                if size > self._queryCache.maxBytes:
+                    res = None
+            yield item
+        if res is not None:
+            self._queryCache.put(key, res, size)
+
+    def _streamStatus(self, statuses, filterString=None, ordering="interleaved", partitions=1, projection=None):
+        jobs = []
+        for status in statuses:
+            n = partitions.get(status, 1) if type(partitions) == dict else partitions
+            for sortKeyRange in self._statusPartitions(status, n):
+                jobs.append((status, partial(self._queryStatus, status, filterString, sortKeyRange, projection)))
+        for item in _merge(jobs, self.maxWorkers, grouped=ordering == "grouped"):
+            if item != "PAGE_END":
+                yield item
+
+    def _filteredStatus(self, statuses, filterString=None, limit=1, pageSize=None, prefetch=0, projection=None):
+        pages = (page for status in statuses for page in self._statusPages(status, filterString, limit, projection=projection))
+        if prefetch > 0:
+            pages = _prefetch(pages, prefetch)
+        count = 0
+        for page in pages:
+            for item in page:
+                yield item
+                count += 1
+                if pageSize and count == pageSize:
+                    yield "PAGE_END"
+                    count = 0
+            if filterString and not pageSize and len(page) > 0:
+                yield "PAGE_END"
+        if pageSize and count > 0:
+            yield "PAGE_END"
+
+    def _checkpointed(self, checkpoint, seen=None):
+        """Run the statuses a checkpoint has still to finish, saving each page to it as it arrives.
+        Pages are written here, on the consuming thread, so the checkpoint files only ever have one writer."""
+        seen = set() if seen is None else seen
+        jobs = [(status, partial(self._statusPages, status, checkpoint.filterString, None,
+                                 projection=checkpoint.projection, startKey=startKey, keys=True))
+                for status, startKey in checkpoint.pending().items()]
+        for status, (items, lastKey) in _merge(jobs, self.maxWorkers, tagged=True):
+            items = [item for item in items if item["id"] not in seen]
+            seen.update(item["id"] for item in items)
+            checkpoint.savePage(status, items, lastKey)
+            yield from items
+
+    def _plan(self, filterString) -> Plan:
+        description = self._describe()
+        itemCount = description.get("ItemCount", 0)
+        itemSize = description.get("TableSizeBytes", 0) // itemCount if itemCount else None
+        return planQuery(filterString, itemCount, itemSize, self._indexRangeKey("status"))
+
+    def _plannedQuery(self, plan, key, projection=None):
+        """Yields the records of one key value of a Plan that uses the primary key or an index."""
+        if plan.access == "key":
+            kwargs = {"ExpressionAttributeNames": {"#id": "id"}, "ExpressionAttributeValues": {":x": key},
+                      "KeyConditionExpression": "#id = :x"}
+            keys = ("id",)
+        elif plan.index == "status":
+            kwargs = self._statusKwargs(key, plan.timeRange)
+            keys = ("id", "status")
+        else:
+            kwargs = {"IndexName": plan.index, "ExpressionAttributeNames": {"#x": plan.index},
+                      "ExpressionAttributeValues": {":y": key}, "KeyConditionExpression": "#x = :y"}
+            keys = ("id", plan.index)
+        checks = []
+        if plan.filterString:
+            kwargs["FilterExpression"], checks = splitFilterString(plan.filterString)
+        if projection:
+            _addProjection(kwargs, _withRequest(projection, checks), keys)
+        for res in self._pages(kwargs):
+            yield from _checkRequests([self._normalise(item) for item in res.get("Items", [])], checks, projection)
+
+    def _bulkGet(self, ids, projection=None):
+        """Yields the records for ids from concurrent BatchGetItem calls, without starting new stats."""
+        ids = list(ids)
+        chunks = [ids[i:i + BATCH_GET_SIZE] for i in range(0, len(ids), BATCH_GET_SIZE)]
+        jobs = [(i, partial(self._batchGet, [{"id": id} for id in chunk], projection)) for i, chunk in enumerate(chunks)]
+        yield from _merge(jobs, self.maxWorkers)
+
+    def _describe(self) -> dict:
+        """The DescribeTable description of the current table, fetched the first time it is needed."""
+        if self._description is None:
+            self._description = self._client.describe_table(TableName=self._tableName)["Table"]
+        return self._description
+
+    def _beginStats(self, name):
+        """Start collecting the stats of a new query into lastStats."""
+        self.lastStats = QueryStats(name)
+
+    def _indexRangeKey(self, indexName):
+        """Returns the sort key of a GSI on the current table, or None if it only has a partition key."""
+        if indexName not in self._indexKeys:
+            rangeKey = None
+            for index in self._describe().get("GlobalSecondaryIndexes", []):
+                if index["IndexName"] == indexName:
+                    for key in index["KeySchema"]:
+                        if key["KeyType"] == "RANGE":
+                            rangeKey = key["AttributeName"]
+            self._indexKeys[indexName] = rangeKey
+        return self._indexKeys[indexName]
+
+    def _statusPartitions(self, status, partitions):
+        """Split a status into sort key ranges of roughly equal width. 
+        The bounds come from two single item queries, one in each direction."""
+        sortKey = self._indexRangeKey("status") if partitions > 1 else None
+        if sortKey is None:
+            return [None]
+        bounds = []
+        for forward in (True, False):
+            kwargs = self._statusKwargs(status)
+            res = self._call("query", dict(kwargs, Limit=1, ScanIndexForward=forward))
+            if len(res.get("Items", [])) == 0:
+                return [None]
+            bounds.append(int(res["Items"][0][sortKey]))
+        low, high = bounds
+        step = max(1, -(-(high - low + 1) // partitions))
+        return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+    def _statusKwargs(self, status, sortKeyRange=None):
+        """Query arguments for one status on the status index, optionally limited to a sort key range."""
         kwargs = {
             "IndexName": "status",
             "ExpressionAttributeNames": {
@@ -113,37 +550,515 @@ class AeviRepo():
             },
             "KeyConditionExpression": "#status = :x",
         }
-        if filterString: # TODO: this needs to parse st_request like filterCache does!
-            expressions = []
-            strings = filterString.split(';')
-            for s in strings:
-                ex = parseFilterString(s.strip())
-                expressions.append(ex)
-            filterExpression = reduce(lambda a, b: a&b, expressions)
-            kwargs["FilterExpression"] = filterExpression
-            kwargs["Limit"] = 1
-        # Paginate!
+        if sortKeyRange:
+            kwargs["ExpressionAttributeNames"]["#sk"] = self._indexRangeKey("status")
+            kwargs["ExpressionAttributeValues"][":lo"], kwargs["ExpressionAttributeValues"][":hi"] = sortKeyRange
+            kwargs["KeyConditionExpression"] += " AND #sk BETWEEN :lo AND :hi"
+        return kwargs
+
+    def _queryStatus(self, status, filterString=None, sortKeyRange=None, projection=None):
+        """Query the current table with the specified status as index, a whole (1 MB) page per request even when filtering."""
+        for page in self._statusPages(status, filterString, None, sortKeyRange, projection):
+            yield from page
+            if filterString and len(page) > 0:
+                yield "PAGE_END"
+
+    def _statusPages(self, status, filterString=None, limit=None, sortKeyRange=None, projection=None, startKey=None, keys=False):
+        """Yields the items of each page of a status query as a list. limit is the items DynamoDB evaluates per
+        request when filtering, None for whole pages.
+        startKey carries on from a page's LastEvaluatedKey, and keys yields (items, LastEvaluatedKey) pairs instead."""
+        kwargs = self._statusKwargs(status, sortKeyRange)
+        checks = []
+        if filterString:
+            kwargs["FilterExpression"], checks = splitFilterString(filterString)
+            if limit:
+                kwargs["Limit"] = limit
+        if projection:
+            _addProjection(kwargs, _withRequest(projection, checks), ("id", "status"))
+        for res in self._pages(kwargs, startKey=startKey):
+            items = _checkRequests([self._normalise(item) for item in res.get("Items", [])], checks, projection)
+            if keys:
+                lastKey = res.get("LastEvaluatedKey")
+                yield items, self._normalise(dict(lastKey)) if lastKey else None
+            else:
+                yield items
+
+    def _queryStatusSince(self, status, since, projection=None):
+        """Yields the records of one status with a timestamp at or after since."""
+        if self._indexRangeKey("status") == "timestamp":
+            kwargs = self._statusKwargs(status, (since, MAX_TIMESTAMP))
+        else:
+            from boto3.dynamodb.conditions import Attr
+            kwargs = self._statusKwargs(status)
+            kwargs["FilterExpression"] = Attr("timestamp").gte(since)
+        if projection:
+            _addProjection(kwargs, projection, ("id", "status", "timestamp", "version"))
+        for res in self._pages(kwargs):
+            for item in res.get("Items", []):
+                yield self._normalise(item)
+
+    def _scanSegment(self, segment, totalSegments, filterString=None, projection=None):
+        """Yields the items of one segment of a parallel scan."""
+        kwargs = {"Segment": segment, "TotalSegments": totalSegments}
+        checks = []
+        if filterString:
+            kwargs["FilterExpression"], checks = splitFilterString(filterString)
+        if projection:
+            _addProjection(kwargs, _withRequest(projection, checks))
+        for res in self._pages(kwargs, "scan"):
+            yield from _checkRequests([self._normalise(item) for item in res.get("Items", [])], checks, projection)
+
+    def _queryFilename(self, filename, projection=None):
+        """Yields (filename, item) for every record in a file, using the transaction_filename_id index."""
+        kwargs = {
+            "IndexName": "transaction_filename_id",
+            "ExpressionAttributeNames": {
+                "#x": "transaction_filename_id"
+            },
+            "ExpressionAttributeValues": {
+                ":y": filename.strip()
+            },
+            "KeyConditionExpression": "#x = :y"
+        }
+        if projection:
+            _addProjection(kwargs, projection, ("id", "transaction_filename_id"))
+        for res in self._pages(kwargs):
+            for item in res.get("Items", []):
+                yield filename, self._normalise(item)
+
+    def _countStatus(self, status, filterString=None):
+        """Yields (status, Count, ScannedCount) for each page of a Select=COUNT query on one status.
+        Conditions on st_request fields have to be checked on the items, so then only st_request is fetched instead."""
+        kwargs = self._statusKwargs(status)
+        kwargs["Select"] = "COUNT"
+        checks = []
+        if filterString:
+            kwargs["FilterExpression"], checks = splitFilterString(filterString)
+        if checks:
+            del kwargs["Select"]
+            _addProjection(kwargs, ["st_request"], ("id", "status"))
+        for res in self._pages(kwargs):
+            count = len(_checkRequests(res.get("Items", []), checks)) if checks else res.get("Count", 0)
+            yield status, count, res.get("ScannedCount", 0)
+
+    def _batchGet(self, keys, projection=None):
+        """Yields the items for up to 100 keys, retrying unprocessed keys until there are none left."""
+        tableName = self._tableName
+        request = _addProjection({}, projection) if projection else {}
+        attempt = 0
+        while keys:
+            res = self._call("batch_get_item", {"RequestItems": {tableName: dict(request, Keys=keys)}})
+            for item in res.get("Responses", {}).get(tableName, []):
+                yield self._normalise(item)
+            keys = res.get("UnprocessedKeys", {}).get(tableName, {}).get("Keys", [])
+            if keys:
+                attempt += 1
+                if attempt > MAX_RETRIES:
+                    raise RuntimeError(f"{len(keys)} keys still unprocessed after {MAX_RETRIES} retries")
+                time.sleep(_backoff(attempt))
+
+    def _pages(self, kwargs, operation="query", startKey=None):
+        """Paginate a query (or scan) on the current table, yielding the raw response for each page.
+        startKey starts after a page a previous run got to. A throttled page is retried from the same
+        ExclusiveStartKey, see _call."""
+        done = False
         while not done:
             if startKey:
                 kwargs["ExclusiveStartKey"] = startKey
-            try:
-                res = self._table.query(**kwargs)
-            except ClientError as ce:
-                print(ce)
-                raise
+            res = self._call(operation, kwargs)
             startKey = res.get("LastEvaluatedKey", None)
             done = startKey is None
-            items = res.get("Items", [])
-            for item in items:
-                for k, v in item.items():
-                    if type(v) == Decimal:
-                        item[k] = int(v)
-                yield item
-            if filterString and len(items) > 0:
-                yield "PAGE_END"
+            yield res
+
+
+    def _call(self, operation, kwargs):
+        """Make one DynamoDB request ("query", "scan" or "batch_get_item"), within the rate limit if one is set.
+        Throttled requests are retried with exponential backoff and jitter rather than aborting the query.
+        Successful requests are recorded in lastStats and passed to the hooks."""
+        kwargs["ReturnConsumedCapacity"] = "TOTAL"
+        attempt = 0
+        while True:
+            if self._limiter:
+                self._limiter.acquire()
+            try:
+                started = time.perf_counter()
+                res = self._clientCall(operation, kwargs)
+                seconds = time.perf_counter() - started
+            except ClientError as ce:
+                if ce.response.get("Error", {}).get("Code") not in THROTTLE_ERRORS or attempt >= MAX_RETRIES:
+                    print(ce)
+                    raise
+                if self._limiter:
+                    self._limiter.throttled()
+                attempt += 1
+                time.sleep(_backoff(attempt))
+                continue
+            if self._limiter:
+                self._limiter.consume(_capacity(res))
+                self._limiter.succeeded()
+            stats = self.lastStats
+            if stats:
+                stats.record(res, seconds)
+            for hook in self._hooks:
+                hook(operation, kwargs, res, seconds)
+            return res
+
+    def _clientCall(self, operation, kwargs):
+        """Make a request with the low-level client, which the query workers can share where they couldn't share
+        a resource. The arguments are the ones the resource layer takes, and items and keys in the response come back
+        as Python values: as the resource layer makes them, or plain (see _fastItem) on the fast path."""
+        from boto3.dynamodb.conditions import ConditionExpressionBuilder
+        deserialise = _fastItem if self.fastPath else _resourceItem
+        request = dict(kwargs)
+        names = dict(request.get("ExpressionAttributeNames", {}))
+        values = {k: _serialise(v) for k, v in request.get("ExpressionAttributeValues", {}).items()}
+        builder = ConditionExpressionBuilder()
+        for key in ("KeyConditionExpression", "FilterExpression"):
+            if key in request and not isinstance(request[key], str):
+                expression = builder.build_expression(request[key], is_key_condition=key == "KeyConditionExpression")
+                request[key] = expression.condition_expression
+                names.update(expression.attribute_name_placeholders)
+                values.update((k, _serialise(v)) for k, v in expression.attribute_value_placeholders.items())
+        if names:
+            request["ExpressionAttributeNames"] = names
+        if values:
+            request["ExpressionAttributeValues"] = values
+        if operation == "batch_get_item":
+            request["RequestItems"] = {
+                table: dict(keys, Keys=[_serialiseKey(k) for k in keys["Keys"]]) for table, keys in request["RequestItems"].items()
+            }
+            res = self._client.batch_get_item(**request)
+            res["Responses"] = {table: [deserialise(i) for i in items] for table, items in res.get("Responses", {}).items()}
+            if res.get("UnprocessedKeys"):
+                res["UnprocessedKeys"] = {
+                    table: dict(keys, Keys=[deserialise(k) for k in keys["Keys"]]) for table, keys in res["UnprocessedKeys"].items()
+                }
+            return res
+        request["TableName"] = self._tableName
+        if "ExclusiveStartKey" in request:
+            request["ExclusiveStartKey"] = _serialiseKey(request["ExclusiveStartKey"])
+        res = getattr(self._client, operation)(**request)
+        if "Items" in res:
+            res["Items"] = [deserialise(i) for i in res["Items"]]
+        if "LastEvaluatedKey" in res:
+            res["LastEvaluatedKey"] = deserialise(res["LastEvaluatedKey"])
+        return res
+
+
+_connections = {}
+_connectionsLock = threading.Lock()
+
+
+def _connect(kind, local, maxWorkers, region=REGION, table=None):
+    """The DynamoDB "resource" or "client" for these settings. boto3 is only imported, and each one only created,
+    the first time it is needed, then it is shared: both are slow to set up and most runs need one at most.
+    Each table gets its own, so the targets of a MultiRepo never share one pool of maxWorkers connections."""
+    key = (kind, local, maxWorkers, region, table)
+    with _connectionsLock:
+        if key not in _connections:
+            from botocore.config import Config
+            if local:
+                import localstack_client.session as boto  # todo: this is only for connecting to localstack
+            else:
+                import boto3 as boto
+            # One pooled connection per worker, so concurrent queries never wait on a socket
+            config = Config(max_pool_connections=maxWorkers + 2, tcp_keepalive=True, retries={"mode": "standard"})
+            _connections[key] = getattr(boto, kind)("dynamodb", region_name=region, config=config)
+        return _connections[key]
+
+
+def _backoff(attempt):
+    """Seconds to wait before a retry: exponential, capped, with full jitter."""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+def _capacity(res):
+    """Read capacity units a response says it consumed."""
+    consumed = res.get("ConsumedCapacity", [])
+    if type(consumed) == dict:
+        consumed = [consumed]
+    return sum(c.get("CapacityUnits", 0) for c in consumed)
+
+
+def _normalise(item):
+    """Convert the Decimals boto3 returns for numbers back into ints."""
+    for k, v in item.items():
+        if type(v) == Decimal:
+            item[k] = int(v)
+    return item
+
+
+def _fastPath(item):
+    """Items from the fast path are already plain Python values."""
+    return item
+
+
+_serializer = None
+_deserializer = None
+_Binary = None
+
+
+def _serialise(value):
+    """A value in DynamoDB's wire format. The TypeSerializer is made once, the first time it is needed."""
+    global _serializer
+    if _serializer is None:
+        from boto3.dynamodb.types import TypeSerializer
+        _serializer = TypeSerializer()
+    return _serializer.serialize(value)
+
+
+def _resourceItem(item):
+    """Deserialise an item in DynamoDB's wire format the way the resource layer does, numbers as Decimals.
+    The TypeDeserializer is made once, the first time it is needed."""
+    global _deserializer
+    if _deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        _deserializer = TypeDeserializer()
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
+
+
+def _binary(value):
+    """boto3's Binary, imported the first time a binary attribute comes back."""
+    global _Binary
+    if _Binary is None:
+        from boto3.dynamodb.types import Binary
+        _Binary = Binary
+    return _Binary(value)
+
+
+def _serialiseKey(key):
+    return {k: _serialise(v) for k, v in key.items()}
+
+
+def _fastItem(item):
+    """Deserialise an item in DynamoDB's wire format ({"status": {"S": "FAILED"}, "version": {"N": "7"}...}).
+    Most attributes are strings, so those are taken straight off; numbers become ints (floats if they have a fraction)
+    instead of the Decimals the resource layer makes, and st_request, a string, is left as it is."""
+    res = {}
+    for k, v in item.items():
+        s = v.get("S")
+        res[k] = s if s is not None else _fastValue(v)
+    return res
+
+
+def _fastValue(value):
+    (tag, v), = value.items()
+    if tag == "S" or tag == "BOOL":
+        return v
+    if tag == "N":
+        return _number(v)
+    if tag == "NULL":
+        return None
+    if tag == "M":
+        return _fastItem(v)
+    if tag == "L":
+        return [_fastValue(i) for i in v]
+    if tag == "SS":
+        return set(v)
+    if tag == "NS":
+        return {_number(n) for n in v}
+    if tag == "B":
+        return _binary(v)
+    if tag == "BS":
+        return {_binary(b) for b in v}
+    raise TypeError(f"Unknown DynamoDB type {tag}")
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        return int(number) if number.is_integer() else number
+
+
+def _addProjection(kwargs, projection, keys=("id",)):
+    """Add a ProjectionExpression for the given attribute names, using placeholders so reserved words are safe.
+    The key attributes are always included. Attributes that already have a placeholder keep it."""
+    names = kwargs.setdefault("ExpressionAttributeNames", {})
+    named = {attr: placeholder for placeholder, attr in names.items()}
+    placeholders = []
+    for i, attr in enumerate(dict.fromkeys(list(keys) + list(projection))):
+        if attr not in named:
+            names[f"#p{i}"] = attr
+            named[attr] = f"#p{i}"
+        placeholders.append(named[attr])
+    kwargs["ProjectionExpression"] = ", ".join(placeholders)
+    return kwargs
+
+
+class _Failure():
+    """Carries an exception from a worker thread to the consumer of _merge."""
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def _put(results, stop, entry):
+    """Put onto a bounded queue without blocking forever once the consumer has gone away."""
+    while not stop.is_set():
+        try:
+            results.put(entry, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _prefetch(iterable, depth):
+    """Iterate in a background thread, keeping up to depth items ready ahead of the consumer."""
+    results = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def work():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                _put(results, stop, item)
+        except Exception as e:
+            _put(results, stop, _Failure(e))
+        finally:
+            _put(results, stop, _DONE)
+
+    threading.Thread(target=work, daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def _merge(jobs, maxWorkers, grouped=False, tagged=False):
+    """Run (key, generatorFunction) jobs on a bounded thread pool and yield their items as a single stream.
+    Several jobs can share a key. If grouped, the items of each key are yielded together, in the order the 
+    keys first appear in jobs, buffering later keys until it is their turn. If tagged, (key, item) pairs are
+    yielded instead. Worker errors are re-raised here."""
+    results = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+
+    def work(key, job):
+        try:
+            for item in job():
+                if stop.is_set():
+                    return
+                _put(results, stop, (key, item))
+        except Exception as e:
+            _put(results, stop, (key, _Failure(e)))
+        finally:
+            _put(results, stop, (key, _DONE))
+
+    remaining = Counter(key for key, _ in jobs)
+    order = list(remaining)
+    buffers = {key: [] for key in order}
+    current = 0
+    pending = len(jobs)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(1, min(maxWorkers, pending))) as pool:
+        try:
+            for key, job in jobs:
+                pool.submit(work, key, job)
+            while pending:
+                key, item = results.get()
+                if item is _DONE:
+                    pending -= 1
+                    remaining[key] -= 1
+                    while grouped and current < len(order) and remaining[order[current]] == 0:
+                        current += 1
+                        if current < len(order):
+                            yield from buffers[order[current]]
+                            buffers[order[current]] = []
+                elif isinstance(item, _Failure):
+                    raise item.error
+                elif grouped and key != order[current]:
+                    buffers[key].append((key, item) if tagged else item)
+                else:
+                    yield (key, item) if tagged else item
+        finally:
+            stop.set()
+
+
+def buildFilterExpression(filterString):
+    """Combine a ';' delimited filter string into a single FilterExpression."""
+    return splitFilterString(filterString)[0]
+
+
+def splitFilterString(filterString):
+    """Split a ';' delimited filter string into a FilterExpression and a list of Predicates to check on the items.
+    Conditions on the fields of st_request (any attribute not in TOP_LEVEL_ATTRS) can't be evaluated by DynamoDB,
+    so they become a contains(st_request, ...) prefilter that cuts most of the transfer, and an exact Predicate."""
+    expressions = []
+    checks = []
+    strings = filterString.split(';')
+    for s in strings:
+        predicate = _requestPredicate(s.strip())
+        if predicate:
+            checks.append(predicate)
+            expressions.append(_requestPrefilter(predicate))
+        else:
+            expressions.append(parseFilterString(s.strip()))
+    return reduce(lambda a, b: a&b, expressions), checks
+
+
+def _requestPredicate(string):
+    """The Predicate for a condition on a field of st_request, None for any other condition."""
+    if '=' in string:
+        op = "="
+        attr, value = string.split('=', 1)
+    elif " contains " in string:
+        op = "contains"
+        attr, value = string.split(" contains ", 1)
+    else:
+        return None
+    attr = attr.strip()
+    if attr in TOP_LEVEL_ATTRS:
+        return None
+    return Predicate(attr, op, value.strip())
+
+
+def _requestPrefilter(predicate):
+    """What st_request must contain for predicate to hold: the field name, and the value as it is written in JSON
+    (unless it is a number, which can be written more than one way)."""
+    from boto3.dynamodb.conditions import Attr
+    condition = Attr("st_request").contains(f'"{predicate.key}"')
+    value = predicate.values[0]
+    if not predicate.numeric and value and json.dumps(value)[1:-1] == value:
+        condition = condition & Attr("st_request").contains(value)
+    return condition
+
+
+def _withRequest(projection, checks):
+    """The projection, plus st_request when it is needed to check the items."""
+    return list(projection) + ["st_request"] if checks and "st_request" not in projection else projection
+
+
+def _checkRequests(items, checks, projection=None):
+    """The items whose st_request fields pass every check. st_request is removed again if it is not in the projection."""
+    if not checks:
+        return items
+    res = []
+    for item in items:
+        try:
+            request = json.loads(item.get("st_request") or "{}")
+        except ValueError:
+            continue
+        if type(request) != dict:
+            continue
+        if all(request.get(p.key) is not None and p.test(request[p.key]) for p in checks):
+            if projection and "st_request" not in projection:
+                del item["st_request"]
+            res.append(item)
+    return res
 
     
 def parseFilterString(string):  
+    from boto3.dynamodb.conditions import Attr, Key
     numericAttrs = ["timestamp", "version", "created_at"]
     if '=' in string:
         split = string.split('=')
@@ -155,11 +1070,9 @@ def parseFilterString(string):
         split = string.split(' contains ')
         return Attr(split[0]).contains(split[1])
     if "between" in string:
-        dtStr = "[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}"
-        expr = re.match(f"between ({dtStr}) and ({dtStr}|now)", string)
-        try:
-            start, end = expr.group(1), expr.group(2)
-            startDate, endDate = dt.fromisoformat(start), dt.fromisoformat(end) if end != "now" else dt.now()
-        except Exception as e:
-            raise 
-        return Key("timestamp").between(int(startDate.timestamp()), int(endDate.timestamp()))
+        # Dates, "now" or timestamps, read the same way the planner reads them
+        expr = re.match(r"\s*between\s+(.+?)\s+and\s+(.+?)\s*$", string)
+        start, end = (toNumber(expr.group(1), True), toNumber(expr.group(2), True)) if expr else (None, None)
+        if start is None or end is None:
+            raise ValueError(f"Can't read the time range in {string.strip()!r}, use dates, now or timestamps")
+        return Key("timestamp").between(start, end)
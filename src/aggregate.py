@@ -0,0 +1,93 @@
+"""Group records by an attribute and total them up in one pass.
+
+Each group has a count, the first and last timestamp and the sum of st_request's mainamount.
+The attribute can be a top level one or a field of st_request. records can be any iterable, e.g. a query generator,
+so a result never has to be held in memory; ResultCache.aggregate does the same over its columns.
+"""
+import json
+import re
+from functools import lru_cache
+
+try:
+    from .predicates import filterRecords, toNumber
+except ImportError:  # Run as a script from src/
+    from predicates import filterRecords, toNumber
+
+ORDERINGS = ("count", "amount", "lastTimestamp")
+
+
+class Group():
+    """The totals of the records sharing one value of the grouped attribute."""
+    __slots__ = ("value", "count", "firstTimestamp", "lastTimestamp", "amount")
+
+    def __init__(self, value):
+        self.value = value
+        self.count = 0
+        self.firstTimestamp = None
+        self.lastTimestamp = None
+        self.amount = 0.0
+
+    def __repr__(self):
+        return f"Group({self.value!r}, count={self.count}, amount={self.amount:.2f})"
+
+    def add(self, timestamp, amount):
+        self.count += 1
+        if timestamp is not None:
+            if self.firstTimestamp is None or timestamp < self.firstTimestamp:
+                self.firstTimestamp = timestamp
+            if self.lastTimestamp is None or timestamp > self.lastTimestamp:
+                self.lastTimestamp = timestamp
+        if amount is not None:
+            self.amount += amount
+
+    def asDict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def aggregate(records, by, filterDict=None) -> dict:
+    """Group records by the attribute by, returning {value: Group}. Records without it are grouped under None.
+    filterDict (see predicates) keeps only the matching records, checked in the same pass."""
+    if filterDict:
+        records = filterRecords(records, filterDict)
+    groups = {}
+    for record in records:
+        if record == "PAGE_END":
+            continue
+        addRecord(groups, by, record.get(by), record.get("timestamp"), record.get("st_request"))
+    return groups
+
+
+def addRecord(groups, by, value, timestamp, st_request):
+    """Count one record into groups. value is the record's by attribute, None to look for it in st_request."""
+    if value is None and type(st_request) == str:
+        value = requestField(st_request, by)
+    group = groups.get(value)
+    if group is None:
+        group = groups[value] = Group(value)
+    group.add(timestamp if type(timestamp) == int else toNumber(timestamp),
+              toNumber(requestField(st_request, "mainamount")) if type(st_request) == str else None)
+
+
+def topGroups(groups, n=10, orderBy="count") -> list:
+    """The n largest groups by count, amount or lastTimestamp."""
+    if orderBy not in ORDERINGS:
+        raise ValueError(f"orderBy must be one of {ORDERINGS}")
+    return sorted(groups.values(), key=lambda g: (getattr(g, orderBy) is not None, getattr(g, orderBy) or 0),
+                  reverse=True)[:n]
+
+
+def requestField(st_request, field):
+    """One field of an st_request JSON string, found without parsing the rest of it. None if it is not there.
+    st_request is a flat object, so the first "field": value pair is the field."""
+    match = _fieldPattern(field).search(st_request)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def _fieldPattern(field):
+    return re.compile(r'"%s"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)' % re.escape(field))
@@ -0,0 +1,111 @@
+"""Checkpoints of long running status queries, so one that stops partway can be carried on instead of run again.
+
+A checkpoint is two files: the records fetched so far, appended a page at a time to a newline delimited JSON file
+(so it can be loaded like any other saved query, see resultfile), and path + ".state", a small JSON file with the
+query and the LastEvaluatedKey each status got to. The records of a page are written before the state that
+points past it, so a query stopped at any moment loses at most the page in flight.
+"""
+import json
+import os
+
+try:
+    from .resultfile import readRecords, writeRecord
+except ImportError:  # Run as a script from src/
+    from resultfile import readRecords, writeRecord
+
+CHECKPOINT_EXTENSIONS = (".ndjson", ".jsonl")  # Plain text, so pages can be appended and a torn last line cut off
+STATE_SUFFIX = ".state"
+REPAIR_BLOCK = 65536  # Bytes read at a time looking back for the last complete line
+
+
+def isCheckpoint(path):
+    """Whether path can hold a checkpoint."""
+    return str(path).endswith(CHECKPOINT_EXTENSIONS)
+
+
+class Checkpoint():
+    """Where a status query has got to: the query itself and, per status, the key to start the next page from
+    and whether it has finished. Records are appended to path by savePage."""
+    def __init__(self, path, table, statuses, filterString=None, projection=None):
+        if not isCheckpoint(path):
+            raise ValueError(f"A checkpoint must be a {' or '.join(CHECKPOINT_EXTENSIONS)} file")
+        self.path = str(path)
+        self.table = table
+        self.filterString = filterString
+        self.projection = projection
+        self.statuses = {status: {"lastKey": None, "done": False, "count": 0} for status in statuses}
+
+    @classmethod
+    def create(cls, path, table, statuses, filterString=None, projection=None):
+        """Start a new checkpoint, replacing any at path."""
+        checkpoint = cls(path, table, statuses, filterString, projection)
+        open(checkpoint.path, "w").close()
+        checkpoint._saveState()
+        return checkpoint
+
+    @classmethod
+    def load(cls, path):
+        """Open an existing checkpoint. A record line left half written when the query stopped is cut off."""
+        with open(str(path) + STATE_SUFFIX, "r") as fp:
+            state = json.load(fp)
+        checkpoint = cls(path, state["table"], [], state["filterString"], state["projection"])
+        checkpoint.statuses = state["statuses"]
+        checkpoint._repair()
+        return checkpoint
+
+    @property
+    def complete(self):
+        return all(s["done"] for s in self.statuses.values())
+
+    def pending(self) -> dict:
+        """{status: key to start from} for every status still to finish, None to start from the first page."""
+        return {status: s["lastKey"] for status, s in self.statuses.items() if not s["done"]}
+
+    def ids(self) -> set:
+        """The ids of the records saved so far."""
+        return {record["id"] for record in self.records()}
+
+    def records(self):
+        """Yields the records saved so far."""
+        return readRecords(self.path)
+
+    def savePage(self, status, items, lastKey):
+        """Append a page of records for status, then record lastKey as where the status carries on from.
+        A lastKey of None means the status has finished."""
+        with open(self.path, "a", encoding="utf-8") as fp:
+            for item in items:
+                writeRecord(fp, item)
+            fp.flush()
+            os.fsync(fp.fileno())
+        state = self.statuses[status]
+        state["lastKey"] = lastKey
+        state["done"] = lastKey is None
+        state["count"] += len(items)
+        self._saveState()
+
+    # Private Methods ---------------------------------------------------------------
+    def _saveState(self):
+        """Write the state to a temporary file and move it into place, so the state on disk is never half written."""
+        state = {"table": self.table, "filterString": self.filterString, "projection": self.projection,
+                 "statuses": self.statuses}
+        temporary = self.path + STATE_SUFFIX + ".tmp"
+        with open(temporary, "w") as fp:
+            json.dump(state, fp, default=str)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temporary, self.path + STATE_SUFFIX)
+
+    def _repair(self):
+        """Cut the file back to just after its last newline, reading back from the end a block at a time."""
+        with open(self.path, "rb+") as fp:
+            size = end = fp.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - REPAIR_BLOCK)
+                fp.seek(start)
+                newline = fp.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end != size:
+                fp.truncate(end)
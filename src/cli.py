@@ -2,14 +2,28 @@
 
 from botocore.exceptions import ClientError
 import aevirepo
+from aggregate import ORDERINGS, topGroups
+from resultstore import STORE_EXTENSIONS, ResultStore, isStore
+from resultfile import isStreamFormat, readRecords, writeRecords
+from checkpoint import isCheckpoint
+from multirepo import SOURCE_KEY, MultiRepo
 import pprint
 import json
 import readline  # Makes taking input() not awful
 from readchar import readchar as read
 from os import system
+import os
+from datetime import datetime as dt
 from colorama import Fore, Style, init
 init()
 
+PAGE_SIZE = 5  # Records shown per screen of a filtered query
+FILTER_LIMIT = 100  # Items DynamoDB evaluates per request of a filtered query
+PREFETCH_PAGES = 3  # Requests fetched in the background while a screen is being read
+QUERY_CACHE_TTL = 300  # Seconds query results are memoised for, unless AEVI_QUERY_CACHE_TTL says otherwise
+TOP_GROUPS = 10  # Groups shown by a group by, unless asked for more
+TABLE = "prod-aevi-Transaction"  # Queried unless AEVI_TABLE says otherwise, in AEVI_REGION (default eu-west-1)
+
 def displayRecord(record):
     string = ""
     for k, v in record.items():
@@ -22,7 +36,12 @@ def displayRecord(record):
         string += '\n'
     print(string)
 
-def runFilteredQuery(repo, args):
+def readProjection():
+    """Read the attributes to fetch, None for whole records."""
+    projection = input("Attributes to fetch in comma delimited string (leave empty for whole records): ")
+    return [a.strip() for a in projection.split(',') if a.strip()] or None
+
+def runFilteredQuery(repo, args, projection=None):
     """Run a query with a filter expression used by the database itself. Currently returns one item at a time with the option to continue or quit."""
     filterString = input("Filter: ")
     if filterString == "":
@@ -30,7 +49,8 @@ def runFilteredQuery(repo, args):
     args.append(filterString)
     print("\n============================")
     try:
-        for item in repo.runFilteredStatusQuery(*args):
+        for item in repo.runFilteredStatusQuery(*args, limit=FILTER_LIMIT, pageSize=PAGE_SIZE, prefetch=PREFETCH_PAGES,
+                                                projection=projection):
             if item not in ["PAGE_END"]:
                 displayRecord(item)
             elif item == "PAGE_END":
@@ -49,29 +69,229 @@ def runQuery(repo):
             raise Exception("CANCEL")
     statuses = input("\nEnter statuses to query in comma delimited string: ")
     args = [statuses.split(',')]
+    projection = readProjection()
     try:
-        if runFilteredQuery(repo, args) == "NO_FILTER":
+        if runFilteredQuery(repo, args, projection) == "NO_FILTER":
             try:
-                runNormalQuery(repo, args)
+                runNormalQuery(repo, args, projection)
             except ClientError:
                 raise
     except ClientError:
         raise
         
-def runNormalQuery(repo, args):
-    """Run a query without any filters. Will cache the result if not of length 0, but will not display the records on screen."""
+def runNormalQuery(repo, args, projection=None):
+    """Run a query without any filters. Will cache the result if not of length 0, but will not display the records on screen.
+    The result can be streamed into a database, or straight to a file instead of being cached.
+    A plain .ndjson file is saved a page at a time, so the query can be resumed if it stops."""
+    path = input("Store in (path to a .db, .sqlite or .ndjson[.gz] file, leave empty to keep in memory): ")
+    if path != "" and not (isCheckpoint(path) or isStreamFormat(path) or isStore(path)):
+        print(f"Can't store in {path}, use {', '.join(STORE_EXTENSIONS)} or .ndjson[.gz]")
+        return
+    print("Querying... ", end='', flush=True)
+    if isCheckpoint(path):
+        saveCheckpointed(path, repo.checkpointStatusQuery(*args, path, projection=projection))
+        return
+    if isStreamFormat(path):
+        print(f"Saved {writeRecords(path, repo.streamStatusQuery(*args, projection=projection))} records!")
+        return
+    if path != "":
+        res = ResultStore.create(path)
+        repo.storeStatusQuery(res, *args, projection=projection)
+    else:
+        res = repo.runStatusQuery(*args, concurrent=True, projection=projection)
+    print(f"Found {len(res)} records!")
+    if len(res) > 0:
+        repo.setCache(res, projection, statuses=args[0] if path == "" else None)
+
+def saveCheckpointed(path, records):
+    """Run a checkpointed query to the end. If it stops, say how to pick it up again."""
+    count = 0
+    try:
+        for _ in records:
+            count += 1
+    except (Exception, KeyboardInterrupt) as e:
+        print(f"\nStopped after {count} records ({e or 'interrupted'}). Resum[E] query with {path} to carry on.")
+        raise Exception("CHECKPOINTED")
+    print(f"Saved {count} records!")
+
+def resumeQuery(repo):
+    """Carry on with a checkpointed query that stopped partway."""
+    path = input("\nPath to the .ndjson file the query was saving to: ")
+    if not isCheckpoint(path) or not os.path.exists(path):
+        print("That isn't a checkpointed query!")
+        return
+    print("Resuming... ", end='', flush=True)
+    saveCheckpointed(path, repo.resumeStatusQuery(path))
+    print("Load it as the cached query? (y/N) ")
+    if read().lower() == 'y':
+        repo.setCache(readRecords(path))
+
+def refreshCachedQuery(repo):
+    """Fetch what has changed since the cached query was run, instead of running it again."""
+    print("\nAlso recheck the status of every cached record, dropping those that moved to another status? "
+          "(uses about as much read capacity as running the query again) (y/N) ")
+    recheck = read().lower() == 'y'
+    print("Refreshing... ", end='', flush=True)
+    try:
+        counts = repo.refreshCache(recheck)
+    except (ValueError, TypeError) as e:
+        print(e)
+        return
+    print(f"{counts['added']} added, {counts['updated']} updated, {counts['dropped']} dropped, {len(repo.getCache())} records cached")
+
+def runPlannedQuery(repo):
+    """Run one filter string the cheapest way the planner finds, after showing the plan, and cache the result."""
+    filterString = input("\nFilter (e.g. status = FAILED,RETRY; between 2021-10-10 00:00:00 and now; terminalid = T0006205): ")
+    if filterString == "":
+        return
+    print("\n====================[PLAN]=====================")
+    print(repo.explainQuery(filterString))
+    print("=====================[END]=====================")
+    print("\nRun it? (y/N) ")
+    if read().lower() != 'y':
+        return
+    projection = readProjection()
+    print("Querying... ", end='', flush=True)
+    res = list(repo.runPlannedQuery(filterString, projection))
+    print(f"Found {len(res)} records!")
+    if len(res) > 0:
+        repo.setCache(res, projection)
+
+def runCountQuery(repo):
+    """Count the records matching a query without downloading any of them."""
+    statuses = input("\nEnter statuses to count in comma delimited string: ")
+    filterString = input("Filter (optional, conditions on st_request fields download st_request to count): ")
+    if filterString and aevirepo.splitFilterString(filterString)[1]:
+        print("This filter has st_request fields, so the st_request of every candidate record will be downloaded. Count anyway? (y/N) ")
+        if read().lower() != 'y':
+            return
+    print("Counting... ", end='', flush=True)
+    counts = repo.countStatusQuery(statuses.split(','), filterString or None)
+    print(f"Found {counts['Count']} records! (scanned {counts['ScannedCount']})")
+    for status, count in counts["statuses"].items():
+        print(f"{status.strip().ljust(30)}{count['Count']} (scanned {count['ScannedCount']})")
+
+def groupRecords(repo):
+    """Group the cached query, or a status query as it streams in, by an attribute and show the largest groups."""
+    useCache = False
+    if len(repo.getCache()) > 0:
+        print("\nGroup the cached query? (Y/n) ")
+        useCache = read().lower() != 'n'
+    if not useCache:
+        statuses = input("\nEnter statuses to group in comma delimited string: ")
+        filterString = input("Filter (optional): ")
+    by = input("Group by attribute (e.g. host_merchant_id, errorcode, currencyiso3a): ").strip()
+    if by == "":
+        return
+    n = input(f"Number of groups to show (default {TOP_GROUPS}): ")
+    orderBy = input(f"Order by ({', '.join(ORDERINGS)}, default count): ").strip() or "count"
+    print("Grouping... ", end='', flush=True)
+    try:
+        if useCache:
+            groups = repo.aggregateCache(by)
+        else:
+            groups = repo.aggregateStatusQuery(statuses.split(','), by, filterString or None)
+        top = topGroups(groups, int(n) if n.strip() else TOP_GROUPS, orderBy)
+    except ValueError as e:
+        print(e)
+        return
+    print(f"{sum(g.count for g in groups.values())} records in {len(groups)} groups")
+    print("\n====================[GROUPS]===================")
+    print(f"{by.ljust(30)}{'count'.rjust(10)}{'mainamount'.rjust(16)}  first - last")
+    for group in top:
+        first, last = (dt.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S") if t else "-"
+                       for t in (group.firstTimestamp, group.lastTimestamp))
+        print(f"{Fore.RED}{str(group.value).ljust(30)}{Style.RESET_ALL}{group.count:>10}{group.amount:>16.2f}  {first} - {last}")
+    print("=====================[END]=====================")
+
+def readList(prompt):
+    """Read a comma delimited list, or a list from a file with one entry per line."""
+    values = input(prompt)
+    if os.path.isfile(values):
+        with open(values) as fp:
+            return fp.read().splitlines()
+    return values.split(',')
+
+def runIdLookup(repo):
+    """Look up records by id, either typed in or read from a file with one id per line, and cache them."""
+    ids = readList("\nIds in comma delimited string, or path to a file of ids: ")
+    projection = readProjection()
+    print("Looking up... ", end='', flush=True)
+    res = list(repo.runBulkIdQuery(ids, projection))
+    print(f"Found {len(res)} records!")
+    if len(res) > 0:
+        repo.setCache(res, projection)
+
+def runFilenameLookup(repo):
+    """Look up every record in one or more files, show how many each file has, and cache them."""
+    filenames = readList("\nFilenames in comma delimited string, or path to a file of filenames: ")
+    projection = readProjection()
+    print("Looking up... ", end='', flush=True)
+    counts = {}
+    res = list(repo.runFilenamesQuery(filenames, counts, projection))
+    print(f"Found {len(res)} records!")
+    for filename, count in counts.items():
+        print(f"{filename.ljust(40)}{count}")
+    if len(res) > 0:
+        repo.setCache(res, projection)
+
+def runFanOutQuery(repo, local):
+    """Run one query against several tables, in any regions, at once and cache the records, tagged with where they
+    came from. A table that can't be queried is reported and the rest are still cached."""
+    default = os.environ.get("AEVI_TARGETS", f"{repo.region}/{repo._tableName}")
+    targets = input(f"\nTables as region/table in comma delimited string (default {default}): ") or default
+    multiRepo = MultiRepo(MultiRepo.parseTargets(targets, repo.region), local, repo.maxWorkers, repo.fastPath)
+    multiRepo.setRateLimit(float(os.environ.get("AEVI_RCU_LIMIT", 0)) or None)
+    print("[S]tatus, [I]d, File[N]ame or [F]ilter query? ")
+    kind = read().lower()
+    if kind == "s":
+        statuses = input("\nEnter statuses to query in comma delimited string: ")
+        filterString = input("Filter (optional): ")
+        query = lambda projection: multiRepo.streamStatusQuery(statuses.split(','), filterString or None, projection)
+    elif kind == "i":
+        ids = readList("\nIds in comma delimited string, or path to a file of ids: ")
+        query = lambda projection: multiRepo.runBulkIdQuery(ids, projection)
+    elif kind == "n":
+        filenames = readList("\nFilenames in comma delimited string, or path to a file of filenames: ")
+        query = lambda projection: multiRepo.runFilenamesQuery(filenames, projection)
+    elif kind == "f":
+        filterString = input("\nFilter (e.g. status = FAILED; errorcode = 30000): ")
+        query = lambda projection: multiRepo.runPlannedQuery(filterString, projection)
+    else:
+        return
+    projection = readProjection()
     print("Querying... ", end='', flush=True)
-    res = repo.runStatusQuery(*args)
+    res = list(query(projection))
     print(f"Found {len(res)} records!")
+    for source in multiRepo.repos:
+        count = sum(1 for r in res if r[SOURCE_KEY] == source)
+        failure = multiRepo.failures.get(source)
+        print(f"{source.ljust(50)}{f'FAILED: {failure}' if failure else count}")
     if len(res) > 0:
+        # Records from other tables can't be completed by id from this one, so they are cached as fetched
         repo.setCache(res)
 
+def runScanExport(repo):
+    """Scan the whole table, either into the cache or straight into a newline delimited JSON file."""
+    path = input("\nExport to (absolute path, leave empty to cache instead): ")
+    filterString = input("Filter (optional): ")
+    args = [filterString or None, readProjection()]
+    print("Scanning... ", end='', flush=True)
+    if path == "":
+        res = list(repo.streamScan(*args))
+        print(f"Found {len(res)} records!")
+        if len(res) > 0:
+            repo.setCache(res, args[1])
+    else:
+        with open(path, "w") as fp:
+            print(f"Exported {repo.runScan(fp, *args)} records!")
+
 def filterCachedQuery(repo):
     """Filter the currently cached query."""
     filterDict = {}
     while True:
         attr = input("\nAttribute: ")
-        val = input(f"Value for {attr}: ")
+        val = input(f"Value for {attr} (x, = x, < x, >= x, between x and y, contains x...): ")
         if val == "" or attr == "":
             print("Invalid field or attribute!")
             continue
@@ -91,23 +311,31 @@ def filterCachedQuery(repo):
 def loadSavedQuery(repo):
     """Load a saved query from the given file path."""
     try:
-        path = input("Absolute path to file (default is ./results.json): ")
+        path = input("Absolute path to file (.json, .ndjson[.gz], .db or .sqlite, default is ./results.json): ")
         if path == "":
             path = "./results.json"
-        repo.setCache(json.load(open(path, "r")))
+        if isStore(path):
+            repo.setCache(ResultStore.load(path))
+        else:
+            repo.setCache(readRecords(path))
     except:
         raise Exception("Can't find that file")
 
 def saveQuery(repo):
     """Save a query to a json file at given path."""
-    path = input("Save as (include absolute path, default is ./results.json): ")
+    path = input("Save as (include absolute path, .db for a database, .ndjson[.gz] to stream, default is ./results.json): ")
     if path == "":
         path = "./results.json"
-    json.dump(repo.getCache(), open(path, "w"))
+    if isStore(path):
+        ResultStore.create(path).insert(repo.getCache())
+    elif isStreamFormat(path):
+        writeRecords(path, repo.getCache())
+    else:
+        json.dump(list(repo.getCache()), open(path, "w"))
 
 def showMenu(repo):
     """Show the main menu for the app. If there is a cached query (either from running one or loading one) the menu will show the save option."""
-    menu = ["[R]un query", "[F]ilter cached query", "[L]oad saved query"]
+    menu = ["[R]un query", "[P]lanned query", "[I]d lookup", "File[N]ame lookup", "[C]ount records", "[W]hole table scan", "[F]ilter cached query", "[G]roup records", "[L]oad saved query", "Resum[E] query", "[A]ll tables query"]
     print("\n===============")
     print("AEVI QUERY v0.1")
     print("===============")
@@ -115,11 +343,41 @@ def showMenu(repo):
         print(item)
     if len(repo.getCache()) > 0:
         print("[S]ave current query")
+        print("[U]pdate cached query")
+    print("Query s[T]ats")
+    print("[M]emoised queries")
     print("[Q]uit")
     print("\nWhat do you want to do? ")
     choice = read().lower()
     return choice
 
+def showStats(repo):
+    """Show how efficient the last query was."""
+    if repo.lastStats is None:
+        print("\nNo query has been run yet")
+        return
+    print("\n====================[STATS]====================")
+    print(repo.lastStats.report())
+    print("=====================[END]=====================")
+
+def manageQueryCache(repo):
+    """Show how the memoised queries are doing, and clear or bypass them."""
+    cache = repo.getQueryCache()
+    if cache is None:
+        print("\nQuery results are not memoised (AEVI_QUERY_CACHE_TTL is 0)")
+        return
+    print("\n================[MEMOISED QUERIES]================")
+    print(cache.report())
+    print(f"Memoisation is {'on' if cache.enabled else 'bypassed'}")
+    print("\n[C]lear, [B]ypass on/off, anything else to go back")
+    choice = read().lower()
+    if choice == 'c':
+        cache.invalidate()
+        print("Cleared")
+    elif choice == 'b':
+        cache.enabled = not cache.enabled
+        print(f"Memoisation is {'on' if cache.enabled else 'bypassed'}")
+
 def quit(repo):
     """Close the app."""
     if len(repo.getCache()) > 0:
@@ -131,8 +389,11 @@ def quit(repo):
 
 def run(local):
     """Run the app. Called by main.py"""
-    repo = aevirepo.AeviRepo(local)
-    repo.setTable('prod-aevi-Transaction')
+    repo = aevirepo.AeviRepo(local, region=os.environ.get("AEVI_REGION", aevirepo.REGION))
+    repo.setTable(os.environ.get("AEVI_TABLE", TABLE))
+    repo.setRateLimit(float(os.environ.get("AEVI_RCU_LIMIT", 0)) or None)
+    repo.setQueryCache(float(os.environ.get("AEVI_QUERY_CACHE_TTL", QUERY_CACHE_TTL)) or None,
+                       spillDir=os.environ.get("AEVI_QUERY_CACHE_DIR"))
     while True:
         choice = showMenu(repo)
         if choice == "q":
@@ -145,11 +406,60 @@ def run(local):
                 continue
             finally:
                 continue
+        elif choice == "p":
+            try:
+                runPlannedQuery(repo)
+            except Exception:
+                continue
+        elif choice == "i":
+            try:
+                runIdLookup(repo)
+            except Exception:
+                continue
+        elif choice == "n":
+            try:
+                runFilenameLookup(repo)
+            except Exception:
+                continue
+        elif choice == "t":
+            showStats(repo)
+        elif choice == "m":
+            manageQueryCache(repo)
+        elif choice == "c":
+            try:
+                runCountQuery(repo)
+            except Exception:
+                continue
+        elif choice == "w":
+            try:
+                runScanExport(repo)
+            except Exception:
+                continue
         elif choice == "f":
             try:
                 filterCachedQuery(repo)
             except:
                 continue
+        elif choice == "a":
+            try:
+                runFanOutQuery(repo, local)
+            except Exception:
+                continue
+        elif choice == "e":
+            try:
+                resumeQuery(repo)
+            except Exception:
+                continue
+        elif choice == "g":
+            try:
+                groupRecords(repo)
+            except Exception:
+                continue
+        elif choice == "u" and len(repo.getCache()) > 0:
+            try:
+                refreshCachedQuery(repo)
+            except Exception:
+                continue
         elif choice == "s" and len(repo.getCache()) > 0:
             saveQuery(repo)
         elif choice == "l":
@@ -1,10 +1,13 @@
 from view.aeviquerywindow import AeviQueryWindow
-from aevirepo import AeviRepo
+from aevirepo import REGION, AeviRepo
 from PySide6.QtWidgets import QApplication
+import os
 import sys
 
 def run(local):
     app = QApplication([])
-    view = AeviQueryWindow()
-    model = AeviRepo(local)
+    model = AeviRepo(local, region=os.environ.get("AEVI_REGION", REGION))
+    model.setTable(os.environ.get("AEVI_TABLE", 'prod-aevi-Transaction'))
+    model.setRateLimit(float(os.environ.get("AEVI_RCU_LIMIT", 0)) or None)
+    view = AeviQueryWindow(model)
     sys.exit(app.exec())
@@ -0,0 +1,87 @@
+"""The same query against several tables at once, e.g. every environment and region running the Aevi schema."""
+from functools import partial
+
+try:
+    from .aevirepo import MAX_WORKERS, AeviRepo, _merge
+except ImportError:  # Run as a script from src/
+    from aevirepo import MAX_WORKERS, AeviRepo, _merge
+
+SOURCE_KEY = "_source"  # Added to every record, "region/table" of the target it came from
+
+
+class MultiRepo():
+    """Runs status, id, filename and planned queries against several (region, table) targets concurrently,
+    each through its own AeviRepo (so its own rate limit, stats and pool of maxWorkers connections), and merges the records
+    into one stream as they arrive, each tagged with its source under SOURCE_KEY.
+    A target that fails is recorded in failures and the others carry on; only if every target fails is the
+    error raised."""
+    def __init__(self, targets, local: bool, maxWorkers: int = MAX_WORKERS, fastPath: bool = False):
+        """targets is a list of (region, table) pairs."""
+        if not targets:
+            raise ValueError("A MultiRepo needs at least one (region, table) target")
+        self.repos = {}
+        for region, table in targets:
+            repo = AeviRepo(local, maxWorkers, fastPath, region)
+            repo.setTable(table)
+            self.repos[f"{region}/{table}"] = repo
+        self.failures = {}
+
+    @staticmethod
+    def parseTargets(string, defaultRegion=None) -> list:
+        """(region, table) pairs from "region/table,region/table". A table without a region is in defaultRegion."""
+        targets = []
+        for target in string.split(','):
+            target = target.strip()
+            if not target:
+                continue
+            region, _, table = target.rpartition('/')
+            targets.append((region or defaultRegion, table))
+        return targets
+
+    def setRateLimit(self, rcuPerSecond=None):
+        """Limit every target to rcuPerSecond, see AeviRepo.setRateLimit. Each table has its own capacity."""
+        for repo in self.repos.values():
+            repo.setRateLimit(rcuPerSecond)
+
+    def stats(self) -> dict:
+        """{source: QueryStats} of the last query, for the targets that ran one."""
+        return {source: repo.lastStats for source, repo in self.repos.items() if repo.lastStats}
+
+    def streamStatusQuery(self, statuses: list, filterString=None, projection=None):
+        """Yields the records of a status query on every target, see AeviRepo.streamStatusQuery."""
+        return self._fanOut(lambda repo: repo.streamStatusQuery(statuses, filterString, projection=projection))
+
+    def runIdQuery(self, id, projection=None):
+        """Yields the record with this id from every target that has one."""
+        return self._fanOut(lambda repo: repo.runIdQuery(id, projection))
+
+    def runBulkIdQuery(self, ids, projection=None):
+        """Yields the records for many ids from every target, see AeviRepo.runBulkIdQuery."""
+        return self._fanOut(lambda repo: repo.runBulkIdQuery(ids, projection))
+
+    def runFilenamesQuery(self, filenames, projection=None):
+        """Yields the records of several files from every target, see AeviRepo.runFilenamesQuery."""
+        return self._fanOut(lambda repo: repo.runFilenamesQuery(filenames, None, projection))
+
+    def runPlannedQuery(self, filterString, projection=None):
+        """Yields the records matching filterString on every target, each planned for its own table's size."""
+        return self._fanOut(lambda repo: repo.runPlannedQuery(filterString, projection))
+
+    # Private Methods ---------------------------------------------------------------
+    def _fanOut(self, query):
+        self.failures = {}
+        jobs = [(source, partial(self._target, source, repo, query)) for source, repo in self.repos.items()]
+        for source, record in _merge(jobs, len(jobs), tagged=True):
+            if record == "PAGE_END":
+                continue
+            yield dict(record, **{SOURCE_KEY: source})
+        if len(self.failures) == len(self.repos):
+            raise next(iter(self.failures.values()))
+
+    def _target(self, source, repo, query):
+        """The records of query on one target. An error ends this target only, and is kept in failures."""
+        try:
+            yield from query(repo)
+        except Exception as e:
+            print(f"{source}: {e}")
+            self.failures[source] = e
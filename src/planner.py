@@ -0,0 +1,117 @@
+"""Choose how to run a filter string against the table.
+
+A filter string is the ';' delimited one the query methods take, e.g.
+    "status = FAILED,RETRY; between 2021-10-10 00:00:00 and 2021-10-15 00:00:00; terminalid = T0006205"
+planQuery looks for conditions an index can answer (id, transaction_filename_id or filename, status and a time range)
+and picks the access path that reads the least: a query on the primary key, a query on one of the GSIs
+(with the time range as a key condition when the status index is sorted by timestamp) or, as a last resort, a scan.
+Whatever the access path does not answer is left as a filter.
+"""
+import math
+import re
+
+try:
+    from .predicates import toNumber
+except ImportError:  # Run as a script from src/
+    from predicates import toNumber
+
+ITEM_SIZE = 2048  # Bytes per item assumed when DynamoDB has not reported the table size yet
+RECORDS_PER_FILE = 1000  # Typical number of records in a transaction file
+STATUS_COUNT = 5  # Distinct statuses, a status is assumed to hold an even share of the table
+RETENTION = 60 * 60 * 24 * 90  # Seconds of transactions the table holds, for the share of a time range
+RCU_BYTES = 4096  # Bytes one eventually consistent read of 0.5 RCU covers
+KEY_ATTRS = {"id": "id", "transaction_filename_id": "transaction_filename_id", "filename": "transaction_filename_id",
+             "status": "status"}
+
+_BETWEEN = re.compile(r"^\s*between\s+(.+?)\s+and\s+(.+?)\s*$")
+
+
+class Plan():
+    """One way to run a filter string: the access path, its key conditions, what is left to filter and what it costs."""
+    def __init__(self, access, index, keys, timeRange, filterString, memberships, items, rcu):
+        self.access = access  # "key" (query on the primary key), "index" or "scan"
+        self.index = index
+        self.keys = keys  # Values of the partition key, one query each
+        self.timeRange = timeRange  # (start, end) of a key condition on the status index's timestamp sort key
+        self.filterString = filterString
+        self.memberships = memberships  # attribute: values, for key conditions on several values the plan does not use
+        self.items = items
+        self.rcu = rcu
+        self.alternatives = []
+
+    def describe(self):
+        if self.access == "scan":
+            return "Scan the table"
+        target = "the primary key" if self.access == "key" else f"the {self.index} index"
+        keyAttr = "id" if self.access == "key" else self.index
+        conditions = [f"{keyAttr} = {key}" for key in self.keys]
+        if self.timeRange:
+            conditions.append(f"timestamp between {self.timeRange[0]} and {self.timeRange[1]}")
+        return f"Query {target} ({', '.join(conditions)})"
+
+    def explain(self):
+        """The plan, its estimated cost and what the alternatives would cost, one line each, for the CLI."""
+        filters = [self.filterString] if self.filterString else []
+        filters += [f"{attr} in {', '.join(values)}" for attr, values in self.memberships.items()]
+        lines = [
+            ("Plan", self.describe()),
+            ("Filter", "; ".join(filters) or "none"),
+            ("Estimated items read", self.items),
+            ("Estimated read capacity", f"{self.rcu:g} RCU"),
+        ]
+        for plan in self.alternatives:
+            lines.append(("Instead of", f"{plan.describe()}: {plan.rcu:g} RCU"))
+        return "\n".join(f"{label.ljust(30)}{value}" for label, value in lines)
+
+
+def planQuery(filterString, itemCount, itemSize=None, statusRangeKey=None) -> Plan:
+    """The cheapest Plan for a filter string on a table of itemCount items of itemSize bytes on average.
+    statusRangeKey is the sort key of the status index, if it has one. Raises ValueError for a time range it can't read."""
+    itemSize = itemSize or ITEM_SIZE
+    keys = {}
+    timeRange = None
+    timePart = None  # The condition timeRange came from, the only one a key condition replaces
+    rest = []
+    for part in (p.strip() for p in filterString.split(';') if p.strip()):
+        match = _BETWEEN.match(part)
+        if match:
+            start, end = toNumber(match.group(1), True), toNumber(match.group(2), True)
+            if start is None or end is None:
+                raise ValueError(f"Can't read the time range in {part!r}, use dates, now or timestamps")
+            if timeRange is None:
+                timeRange, timePart = (start, end), part
+        if '=' in part and not match:
+            attr, value = (s.strip() for s in part.split('=', 1))
+            if attr in KEY_ATTRS and KEY_ATTRS[attr] not in keys:
+                keys[KEY_ATTRS[attr]] = list(dict.fromkeys(v.strip() for v in value.split(',') if v.strip()))
+                continue
+        rest.append(part)
+
+    def cost(items, queries=1):
+        """Items read and RCU, each query costing at least one read."""
+        return items, max(0.5 * queries, math.ceil(items * itemSize / RCU_BYTES) * 0.5)
+
+    def plan(access, index, used, items, sortable=None, queries=1):
+        """A Plan using the key conditions on used, the others becoming filters (or memberships, for several values)."""
+        unused = {attr: values for attr, values in keys.items() if attr != used}
+        parts = [f"{attr} = {values[0]}" for attr, values in unused.items() if len(values) == 1]
+        parts += [part for part in rest if not (sortable and part is timePart)]
+        memberships = {attr: values for attr, values in unused.items() if len(values) > 1}
+        return Plan(access, index, keys.get(used, []), sortable, "; ".join(parts), memberships, *cost(items, queries))
+
+    plans = []
+    if "id" in keys:
+        plans.append(plan("key", None, "id", len(keys["id"]), queries=len(keys["id"])))
+    if "transaction_filename_id" in keys:
+        items = min(itemCount, len(keys["transaction_filename_id"]) * RECORDS_PER_FILE)
+        plans.append(plan("index", "transaction_filename_id", "transaction_filename_id", items))
+    if "status" in keys:
+        items = min(itemCount, math.ceil(itemCount * len(keys["status"]) / STATUS_COUNT))
+        sortable = timeRange if statusRangeKey == "timestamp" else None
+        if sortable:
+            items = math.ceil(items * min(1, max(0, sortable[1] - sortable[0]) / RETENTION))
+        plans.append(plan("index", "status", "status", items, sortable))
+    plans.append(plan("scan", None, None, itemCount))  # Last, so a key or index wins a tie
+    best = min(plans, key=lambda p: p.rcu)
+    best.alternatives = [p for p in plans if p is not best]
+    return best
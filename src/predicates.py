@@ -0,0 +1,150 @@
+"""Typed filters for cached records.
+
+A filter is a dict of attribute: condition, where the condition is one of
+    "= x", "!= x", "< x", "<= x", "> x", ">= x", "between x and y", "contains x"
+or a plain value, which means "= x" for numeric attributes and "contains x" for everything else.
+A (low, high) tuple is the same as "between low and high".
+Values of numeric attributes are compared as numbers, timestamps can also be given as "YYYY-MM-DD HH:MM:SS" or "now".
+A condition matches a record if the attribute or the st_request field of the same name matches, except for "!= x",
+the opposite of "= x", which matches only if neither of them is x.
+"""
+import json
+import re
+from datetime import datetime as dt
+
+NUMERIC_ATTRS = ("timestamp", "version", "created_at", "send_attempts", "mainamount")
+DATE_ATTRS = ("timestamp", "created_at")
+RANGE_OPS = ("=", "<", "<=", ">", ">=", "between")
+
+_OPERATOR = re.compile(r"^\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*$")
+_BETWEEN = re.compile(r"^\s*between\s+(.+?)\s+and\s+(.+?)\s*$")
+_CONTAINS = re.compile(r"^\s*contains\s+(.*?)\s*$")
+
+
+class Predicate():
+    """One typed comparison of an attribute against a value (or two, for between)."""
+    def __init__(self, key, op, *values):
+        self.key = key
+        self.op = op
+        self.numeric = key in NUMERIC_ATTRS
+        if self.numeric and op != "contains":
+            values = tuple(toNumber(v, key in DATE_ATTRS) for v in values)
+            if None in values:
+                raise ValueError(f"{key} needs a numeric value")
+        else:
+            values = tuple(str(v) for v in values)
+        self.values = values
+
+    def __repr__(self):
+        return f"Predicate({self.key!r}, {self.op!r}, {', '.join(repr(v) for v in self.values)})"
+
+    def test(self, value):
+        """Test a single attribute value. A missing (None) value never matches, not even !=."""
+        if value is None:
+            return False
+        if self.op == "contains":
+            return self.values[0] in str(value)
+        if self.numeric:
+            value = toNumber(value)
+            if value is None:
+                return False
+        else:
+            value = str(value)
+        v = self.values[0]
+        if self.op == "=":
+            return value == v
+        if self.op == "!=":
+            return value != v
+        if self.op == "<":
+            return value < v
+        if self.op == "<=":
+            return value <= v
+        if self.op == ">":
+            return value > v
+        if self.op == ">=":
+            return value >= v
+        return v <= value <= self.values[1]
+
+    def testEither(self, value, requestValue):
+        """Test an attribute's value and the st_request field of the same name, either of which may be None.
+        Either matching is enough, except for != where every value present has to match."""
+        if self.op == "!=":
+            if value is None and requestValue is None:
+                return False
+            return (value is None or self.test(value)) and (requestValue is None or self.test(requestValue))
+        return self.test(value) or self.test(requestValue)
+
+    def matches(self, item, request):
+        """Test a record and its parsed st_request, see testEither."""
+        return self.testEither(item.get(self.key, None), request.get(self.key, None))
+
+
+def parsePredicate(key, condition):
+    """Parse one attribute: condition pair of a filter dict into a Predicate."""
+    if type(condition) == tuple:
+        return Predicate(key, "between", *condition)
+    condition = str(condition)
+    match = _BETWEEN.match(condition)
+    if match:
+        return Predicate(key, "between", match.group(1), match.group(2))
+    match = _CONTAINS.match(condition)
+    if match:
+        return Predicate(key, "contains", match.group(1))
+    match = _OPERATOR.match(condition)
+    if match:
+        return Predicate(key, match.group(1), match.group(2))
+    return Predicate(key, "=" if key in NUMERIC_ATTRS else "contains", condition)
+
+
+def compileFilter(filterDict):
+    """Parse a filter dict once into a list of Predicates."""
+    return [parsePredicate(k, v) for k, v in filterDict.items()]
+
+
+def filterRecords(records, filterDict):
+    """Yields the records from any iterable that match filterDict, one at a time, so the records never have to be
+    held in memory. st_request is only parsed for records that reach a condition needing it."""
+    predicates = compileFilter(filterDict)
+    for record in records:
+        if record == "PAGE_END":
+            continue
+        request = None
+        match = True
+        for predicate in predicates:
+            if predicate.op != "!=" and predicate.test(record.get(predicate.key, None)):
+                continue
+            if request is None:
+                request = _request(record)
+            if not predicate.matches(record, request):
+                match = False
+                break
+        if match:
+            yield record
+
+
+def _request(record):
+    try:
+        request = json.loads(record["st_request"])
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return request if type(request) == dict else {}
+
+
+def toNumber(value, dates=False):
+    """An int or float from a number or numeric string, or None. With dates, also accepts ISO datetimes and "now"."""
+    if type(value) in (int, float):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if dates:
+        try:
+            return int((dt.now() if value == "now" else dt.fromisoformat(value)).timestamp())
+        except (TypeError, ValueError):
+            pass
+    return None
@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+TTL = 300  # Seconds a memoised result stays valid
+MAX_BYTES = 256 * 2**20  # Memory the memoised results may take, estimated with recordSize
+
+
+class QueryCache():
+    """Memoised query results, keyed on the normalised query (see key), so repeating a query within ttl seconds
+    costs nothing. Results are evicted least recently used first once they take more than maxBytes, and a result
+    bigger than maxBytes on its own is never memoised. With a spillDir, evicted results are written there as
+    gzipped JSON and read back on the next hit instead of being dropped.
+    Unlike the working set cache of AeviRepo.setCache, this holds many results and never needs to be filtered."""
+    def __init__(self, ttl=TTL, maxBytes=MAX_BYTES, spillDir=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self.spillDir = spillDir
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # key: (expires, size, results), least recently used first
+        self._spilled = {}  # key: (expires, path)
+        self._clock = clock
+        self._lock = threading.Lock()
+        if spillDir:
+            os.makedirs(spillDir, exist_ok=True)
+
+    @staticmethod
+    def key(kind, index=None, values=(), filterString=None, projection=None, table=None, **options):
+        """A query of table as a string, the same whatever the order of its projection or the whitespace around its values."""
+        return json.dumps([
+            table,
+            kind,
+            index,
+            list(dict.fromkeys(str(v).strip() for v in values)),
+            filterString.strip() if filterString else None,
+            sorted(set(projection)) if projection else None,
+            options,
+        ], sort_keys=True)
+
+    def get(self, key):
+        """The results memoised for key, or None if there are none, they have expired, or the cache is bypassed."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry:
+                self._drop(key)
+            spilled = self._spilled.pop(key, None)
+            if spilled and spilled[0] > now:
+                with gzip.open(spilled[1], "rt") as fp:
+                    results = json.load(fp)
+                os.remove(spilled[1])
+                self._store(key, results, spilled[0], resultsSize(results))
+                self.hits += 1
+                return results
+            if spilled:
+                os.remove(spilled[1])
+            self.misses += 1
+            return None
+
+    def put(self, key, results, size=None):
+        """Memoise the results (a list or dict of JSON serialisable values) of the query key.
+        size is their estimated memory, if it has already been added up. Results bigger than maxBytes are not kept."""
+        if not self.enabled:
+            return
+        size = resultsSize(results) if size is None else size
+        with self._lock:
+            self._drop(key)
+            if size <= self.maxBytes:
+                self._store(key, results, self._clock() + self.ttl, size)
+
+    def invalidate(self, key=None):
+        """Forget the results of one query, or of every query."""
+        with self._lock:
+            for k in [key] if key else list(self._entries) + list(self._spilled):
+                self._drop(k)
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def report(self):
+        """Hit/miss counters and size, one line, for the CLI."""
+        lookups = self.hits + self.misses
+        return (f"{len(self)} queries memoised ({self.bytes / 2**20:.1f} MiB in memory, {len(self._spilled)} spilled), "
+                f"{self.hits} hits, {self.misses} misses ({self.hits / lookups if lookups else 0:.0%} hit rate), "
+                f"{self.evictions} evictions")
+
+    # Private Methods ---------------------------------------------------------------
+    def _store(self, key, results, expires, size):
+        self._entries[key] = (expires, size, results)
+        self.bytes += size
+        while self.bytes > self.maxBytes and self._entries:
+            evicted, (evictedExpires, evictedSize, evictedResults) = self._entries.popitem(last=False)
+            self.bytes -= evictedSize
+            self.evictions += 1
+            if self.spillDir:
+                path = os.path.join(self.spillDir, hashlib.sha1(evicted.encode()).hexdigest() + ".json.gz")
+                with gzip.open(path, "wt") as fp:
+                    json.dump(evictedResults, fp, default=str)
+                self._spilled[evicted] = (evictedExpires, path)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.bytes -= entry[1]
+        spilled = self._spilled.pop(key, None)
+        if spilled and os.path.exists(spilled[1]):
+            os.remove(spilled[1])
+
+
+def recordSize(record) -> int:
+    """Roughly the memory a record takes: the dict and its values. Keys are shared between records so are not counted."""
+    if type(record) != dict:
+        return sys.getsizeof(record)
+    return sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values())
+
+
+def resultsSize(results) -> int:
+    """Roughly the memory a result takes, see recordSize."""
+    if type(results) == list:
+        return sys.getsizeof(results) + sum(recordSize(r) for r in results)
+    return recordSize(results)
@@ -0,0 +1,73 @@
+import threading
+import time
+
+
+class QueryStats():
+    """What one query cost: requests (pages) made, items returned against items DynamoDB read, read capacity,
+    bytes transferred and how long each page took. Filled in by AeviRepo as the query runs, from any worker thread.
+    Bytes come from each response's content-length. A page without one is counted in unsizedPages rather than
+    serialised again just to measure it."""
+    def __init__(self, name):
+        self.name = name
+        self.pages = 0
+        self.count = 0
+        self.scannedCount = 0
+        self.consumedCapacity = 0.0
+        self.bytes = 0
+        self.unsizedPages = 0
+        self.latencies = []
+        self.started = time.monotonic()
+        self.finished = self.started
+        self._lock = threading.Lock()
+
+    def record(self, res, seconds):
+        """Add one response, and the seconds its request took."""
+        items = res.get("Items")
+        if items is None:
+            items = [i for r in res.get("Responses", {}).values() for i in r]
+        count = res.get("Count", len(items))
+        size = res.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get("content-length")
+        consumed = res.get("ConsumedCapacity", [])
+        if type(consumed) == dict:
+            consumed = [consumed]
+        with self._lock:
+            self.pages += 1
+            self.count += count
+            self.scannedCount += res.get("ScannedCount", count)
+            self.consumedCapacity += sum(c.get("CapacityUnits", 0) for c in consumed)
+            if size:
+                self.bytes += int(size)
+            else:
+                self.unsizedPages += 1
+            self.latencies.append(seconds)
+            self.finished = time.monotonic()
+
+    @property
+    def selectivity(self):
+        """Share of the items read that the filter kept."""
+        return self.count / self.scannedCount if self.scannedCount else 1.0
+
+    @property
+    def elapsed(self):
+        return self.finished - self.started
+
+    def summary(self):
+        """One line, e.g. "scanned 480000, returned 12, filter selectivity 0.0025%"."""
+        return f"scanned {self.scannedCount}, returned {self.count}, filter selectivity {self.selectivity:.4%}"
+
+    def report(self):
+        """Every figure, one per line, for the CLI."""
+        latencies = sorted(self.latencies)
+        lines = [
+            ("Query", self.name),
+            ("Efficiency", self.summary()),
+            ("Pages", self.pages),
+            ("Read capacity", f"{self.consumedCapacity:g} RCU"),
+            ("Transferred", f"{self.bytes / 1024:.1f} KiB" + (f" ({self.unsizedPages} pages without a size not counted)"
+                                                              if self.unsizedPages else "")),
+            ("Elapsed", f"{self.elapsed:.3f} s"),
+        ]
+        if latencies:
+            lines.append(("Page latency", f"min {latencies[0] * 1000:.1f} ms, median {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+                                          f"max {latencies[-1] * 1000:.1f} ms"))
+        return "\n".join(f"{label.ljust(30)}{value}" for label, value in lines)
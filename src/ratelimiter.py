@@ -0,0 +1,59 @@
+import threading
+import time
+
+MIN_RATE_FRACTION = 0.05  # Throttling never slows the limiter below this fraction of its budget
+RECOVERY_FRACTION = 0.05  # Share of the budget won back after each successful request
+
+
+class RateLimiter():
+    """Token bucket of read capacity units per second, shared by every worker of an AeviRepo.
+    DynamoDB only says what a request cost once it has run (ReturnConsumedCapacity), so a request may start
+    whenever the bucket is not empty and its cost is taken afterwards, leaving the bucket in debt if it was large.
+    The rate adapts: it halves whenever DynamoDB throttles a request and creeps back up to the budget as requests succeed."""
+    def __init__(self, rcuPerSecond, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rcuPerSecond <= 0:
+            raise ValueError("rcuPerSecond must be positive")
+        self.budget = float(rcuPerSecond)
+        self.rate = self.budget
+        self.capacity = float(burst or rcuPerSecond)
+        self.consumed = 0.0
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the bucket has capacity for another request."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens > 0:
+                    return
+                wait = -self._tokens / self.rate + 0.001
+            self._sleep(wait)
+
+    def consume(self, units):
+        """Take the capacity a finished request consumed."""
+        with self._lock:
+            self._refill()
+            self._tokens -= units
+            self.consumed += units
+
+    def throttled(self):
+        """DynamoDB throttled a request: halve the rate and empty the bucket."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.budget * MIN_RATE_FRACTION, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def succeeded(self):
+        """A request went through: recover some of the rate lost to throttling."""
+        with self._lock:
+            self.rate = min(self.budget, self.rate + self.budget * RECOVERY_FRACTION)
+
+    # Private Methods ---------------------------------------------------------------
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
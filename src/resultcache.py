@@ -0,0 +1,332 @@
+import json
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
+
+try:
+    from .aggregate import addRecord, requestField
+    from .predicates import RANGE_OPS, compileFilter
+except ImportError:  # Run as a script from src/
+    from aggregate import addRecord, requestField
+    from predicates import RANGE_OPS, compileFilter
+
+INDEXED_KEYS = ("status", "errorcode", "host_merchant_id", "sitereference", "terminalid")
+SORTED_KEYS = ("timestamp", "created_at")
+# Low cardinality strings, stored once each with a small integer code per record
+DICTIONARY_KEYS = ("status", "errormessage", "errorcode", "expected_error_code", "expiration_month",
+                   "host_merchant_id", "host_device_id")
+INTEGER_KEYS = ("timestamp", "created_at", "version", "send_attempts")
+REQUEST_CACHE_SIZE = 10000  # Whole parsed st_requests kept around for repeated access to a record
+INTERN_LENGTH = 48  # Longer strings (ids, st_request) are rarely repeated so are not interned
+
+_MISSING = object()
+
+
+class _ListColumn():
+    """Any values, one list slot per record. Short strings are interned so repeats share memory."""
+    def __init__(self, values=()):
+        self._values = []
+        for value in values:
+            self.append(value)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        return self._values[i]
+
+    def append(self, value):
+        self._values.append(sys.intern(value) if type(value) == str and len(value) <= INTERN_LENGTH else value)
+        return True
+
+
+class _DictionaryColumn():
+    """Strings encoded as indexes into a list of the distinct values. -1 is a missing value."""
+    def __init__(self):
+        self._codes = array("i")
+        self.values = []
+        self._lookup = {}
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, i):
+        code = self._codes[i]
+        return _MISSING if code < 0 else self.values[code]
+
+    def append(self, value):
+        if value is _MISSING:
+            self._codes.append(-1)
+            return True
+        if type(value) != str:
+            return False
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        self._codes.append(code)
+        return True
+
+
+class _IntegerColumn():
+    """64 bit integers in a flat array, with missing values tracked separately."""
+    def __init__(self):
+        self._values = array("q")
+        self._missing = set()
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        return _MISSING if i in self._missing else self._values[i]
+
+    def append(self, value):
+        if value is _MISSING:
+            self._missing.add(len(self._values))
+            self._values.append(0)
+            return True
+        if type(value) != int or not -2**63 <= value < 2**63:
+            return False
+        self._values.append(value)
+        return True
+
+
+class ResultCache(Sequence):
+    """The cached result of a query. Behaves like a read only list of records.
+    Records are stored by column: dictionary encoded strings, integer arrays and the raw st_request,
+    and rebuilt as plain dicts when accessed, so changing a returned record does not change the cache.
+    The st_request fields filters need are pulled out into columns of their own the first time each is needed,
+    so filtering again never reads st_request. Filters on the common keys are answered from hash indexes and
+    ranges on timestamp/created_at from a sorted index, both built on first use.
+    If the records were fetched with a projection, fetch is called with a list of ids to get the whole records
+    whenever a filter needs an attribute that was not fetched."""
+    def __init__(self, records=(), projection=None, fetch=None):
+        self.projection = set(projection) | {"id"} if projection else None
+        self._fetch = fetch
+        self._complete = {}
+        self._columns = {}
+        self._length = 0
+        self._requests = OrderedDict()
+        self._fields = {}
+        self._indexes = {}
+        self._sorted = {}
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return [self[j] for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("cache index out of range")
+        if i in self._complete:
+            return dict(self._complete[i])
+        record = {}
+        for key, column in self._columns.items():
+            value = column[i]
+            if value is not _MISSING:
+                record[key] = value
+        return record
+
+    def append(self, record):
+        """Add a record to the end of the cache."""
+        for key in record:
+            if key not in self._columns:
+                self._columns[key] = self._newColumn(key)
+        for key, column in self._columns.items():
+            value = record.get(key, _MISSING)
+            if not column.append(value):
+                column = self._columns[key] = _ListColumn(column[j] for j in range(self._length))
+                column.append(value)
+        for key, column in self._fields.items():
+            column.append(self._requestField(key, self._length))
+        self._length += 1
+        self._indexes = {}
+        self._sorted = {}
+
+    def has(self, attr):
+        """Whether attr was fetched for every record (or the st_request field attr, if st_request was)."""
+        return self.projection is None or attr in self.projection or "st_request" in self.projection
+
+    def complete(self, positions=None) -> int:
+        """Fetch the whole records for positions (all by default) that only have the projected attributes.
+        Returns the number of records fetched."""
+        if self.projection is None or self._fetch is None:
+            return 0
+        positions = range(self._length) if positions is None else positions
+        missing = {}
+        for i in positions:
+            if i not in self._complete:
+                missing.setdefault(self._value("id", i), []).append(i)
+        count = 0
+        for record in self._fetch(list(missing)):
+            for i in missing.get(record["id"], []):
+                self._complete[i] = record
+                self._requests.pop(i, None)
+                for key, column in self._fields.items():
+                    column._values[i] = self._requestField(key, i)
+                count += 1
+        return count
+
+    def max(self, attr):
+        """The largest value of a numeric attribute, None if no record has one."""
+        column = self._columns.get(attr)
+        if column is None:
+            return None
+        values = [v for v in (column[i] for i in range(self._length)) if type(v) in (int, float)]
+        return max(values) if values else None
+
+    def aggregate(self, by, positions=None) -> dict:
+        """Group the records (or those at positions) by the attribute by, see aggregate.aggregate.
+        Reads the by, timestamp and st_request columns directly instead of rebuilding records, and only picks
+        mainamount (and by, if it is an st_request field) out of st_request rather than parsing all of it.
+        Records missing attributes outside the projection are completed first."""
+        if not (self.has(by) and self.has("mainamount")):
+            self.complete(positions)
+        positions = range(self._length) if positions is None else positions
+        values, timestamps, requests = (self._columns.get(key) for key in (by, "timestamp", "st_request"))
+        groups = {}
+        for i in positions:
+            if i in self._complete:
+                record = self._complete[i]
+                value, timestamp, request = record.get(by), record.get("timestamp"), record.get("st_request")
+            else:
+                value = values[i] if values is not None else _MISSING
+                timestamp = timestamps[i] if timestamps is not None else _MISSING
+                request = requests[i] if requests is not None else _MISSING
+                value, timestamp, request = (None if v is _MISSING else v for v in (value, timestamp, request))
+            addRecord(groups, by, value, timestamp, request)
+        return groups
+
+    def request(self, i):
+        """The parsed st_request of the record at position i. Filters use requestValue instead."""
+        if i in self._requests:
+            self._requests.move_to_end(i)
+            return self._requests[i]
+        try:
+            request = json.loads(self._value("st_request", i))
+        except (KeyError, TypeError, ValueError):
+            request = {}
+        self._requests[i] = request
+        if len(self._requests) > REQUEST_CACHE_SIZE:
+            self._requests.popitem(last=False)
+        return request
+
+    def requestValue(self, key, i):
+        """The st_request field key of the record at position i, None if it has none. The field is pulled out of
+        every record's st_request the first time it is asked for, and kept as a column."""
+        column = self._fields.get(key)
+        if column is None:
+            column = self._fields[key] = _ListColumn(self._requestField(key, j) for j in range(self._length))
+        return column[i]
+
+    def filter(self, filterDict):
+        """Returns the records matching every condition in filterDict, in cache order. See predicates for the syntax.
+        Comparisons on timestamp/created_at are answered from the sorted index and conditions on the indexed keys
+        are tested once per distinct value. The hits are intersected and the rest are checked in one pass.
+        Conditions on attributes outside the projection are checked last, on the whole records of what is left."""
+        candidates = None
+        remaining = []
+        deferred = []
+        for predicate in compileFilter(filterDict):
+            if not self.has(predicate.key) and self._fetch is not None:
+                deferred.append(predicate)
+            elif predicate.key in SORTED_KEYS and predicate.op in RANGE_OPS:
+                positions = self._range(predicate)
+            elif predicate.key in INDEXED_KEYS:
+                positions = self._lookup(predicate)
+            else:
+                remaining.append(predicate)
+                continue
+            candidates = positions if candidates is None else candidates & positions
+        positions = range(self._length) if candidates is None else sorted(candidates)
+        positions = [i for i in positions if all(self._matches(p, i) for p in remaining)]
+        if deferred:
+            self.complete(positions)
+            positions = [i for i in positions if all(self._matches(p, i) for p in deferred)]
+        return [self[i] for i in positions]
+
+    # Private Methods ---------------------------------------------------------------
+    def _newColumn(self, key):
+        """A column for a key first seen after self._length records, which are all missing it."""
+        if key in DICTIONARY_KEYS:
+            column = _DictionaryColumn()
+        elif key in INTEGER_KEYS:
+            column = _IntegerColumn()
+        else:
+            column = _ListColumn()
+        for _ in range(self._length):
+            column.append(_MISSING)
+        return column
+
+    def _value(self, key, i):
+        if i in self._complete:
+            return self._complete[i].get(key)
+        column = self._columns.get(key)
+        value = _MISSING if column is None else column[i]
+        return None if value is _MISSING else value
+
+    def _requestField(self, key, i):
+        request = self._value("st_request", i)
+        return requestField(request, key) if type(request) == str else None
+
+    def _matches(self, predicate, i):
+        """Whether the record at position i matches, see Predicate.testEither. Its st_request field is only read
+        if the attribute doesn't match, or for !=."""
+        value = self._value(predicate.key, i)
+        if predicate.op != "!=" and predicate.test(value):
+            return True
+        return predicate.testEither(value, self.requestValue(predicate.key, i))
+
+    def _index(self, key):
+        """Hash index of str(value): positions, over both the attribute and the st_request field.
+        Missing values are left out, since no condition matches them."""
+        if key not in self._indexes:
+            index = {}
+            for i in range(self._length):
+                for value in {str(v) for v in (self._value(key, i), self.requestValue(key, i)) if v is not None}:
+                    index.setdefault(value, []).append(i)
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _lookup(self, predicate):
+        """Positions matching a predicate on an indexed key. Only the distinct values are tested.
+        For != a record is left out if either of its values fails."""
+        positions = set()
+        excluded = set()
+        for value, found in self._index(predicate.key).items():
+            if predicate.test(value):
+                positions.update(found)
+            elif predicate.op == "!=":
+                excluded.update(found)
+        return positions - excluded
+
+    def _range(self, predicate):
+        """Positions matching a comparison on a sorted key."""
+        key = predicate.key
+        if key not in self._sorted:
+            pairs = []
+            for i in range(self._length):
+                try:
+                    pairs.append((int(self._value(key, i)), i))
+                except (TypeError, ValueError):
+                    continue
+            pairs.sort()
+            self._sorted[key] = (array("q", (v for v, _ in pairs)), array("q", (i for _, i in pairs)))
+        values, positions = self._sorted[key]
+        v = predicate.values[0]
+        start, end = {
+            "=": lambda: (bisect_left(values, v), bisect_right(values, v)),
+            "<": lambda: (0, bisect_left(values, v)),
+            "<=": lambda: (0, bisect_right(values, v)),
+            ">": lambda: (bisect_right(values, v), len(values)),
+            ">=": lambda: (bisect_left(values, v), len(values)),
+            "between": lambda: (bisect_left(values, v), bisect_right(values, predicate.values[1])),
+        }[predicate.op]()
+        return set(positions[start:end])
@@ -0,0 +1,63 @@
+"""Saving and loading query results as files.
+
+Results are written as newline delimited JSON, one record per line, optionally compressed by extension:
+.ndjson/.jsonl, .ndjson.gz and .ndjson.zst (needs the zstandard package). Both directions stream, so a result never
+has to fit in memory. Plain .json files hold a single array, the original save format, and can still be loaded.
+"""
+import gzip
+import io
+import json
+
+STREAM_EXTENSIONS = (".ndjson", ".jsonl", ".ndjson.gz", ".jsonl.gz", ".ndjson.zst", ".jsonl.zst")
+
+
+def isStreamFormat(path):
+    """Whether path is saved as newline delimited JSON."""
+    return str(path).endswith(STREAM_EXTENSIONS)
+
+
+def openRecords(path, mode="r"):
+    """Open a results file as text for reading ("r") or writing ("w"), decompressing by extension."""
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading and writing .zst files needs the zstandard package")
+        if mode == "r":
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")), encoding="utf-8")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def writeRecord(fp, record):
+    """Write one record as a line of JSON."""
+    fp.write(json.dumps(record, default=str) + "\n")
+
+
+def writeRecords(path, records) -> int:
+    """Write records from any iterable (e.g. a query generator) as they arrive. PAGE_END markers are skipped.
+    Returns the number of records written."""
+    count = 0
+    with openRecords(path, "w") as fp:
+        for record in records:
+            if record == "PAGE_END":
+                continue
+            writeRecord(fp, record)
+            count += 1
+    return count
+
+
+def readRecords(path):
+    """Yields the records in a results file. Newline delimited files are read one line at a time,
+    anything else is loaded as a JSON array."""
+    if not isStreamFormat(path):
+        with open(path, "r") as fp:
+            yield from json.load(fp)
+        return
+    with openRecords(path) as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
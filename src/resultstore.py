@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+from collections.abc import Sequence
+
+try:
+    from .predicates import compileFilter
+except ImportError:  # Run as a script from src/
+    from predicates import compileFilter
+
+BATCH_SIZE = 1000  # Records inserted per transaction
+STORE_EXTENSIONS = (".db", ".sqlite")
+# Top level attributes with their own column
+COLUMNS = {
+    "id": "TEXT",
+    "status": "TEXT",
+    "timestamp": "INTEGER",
+    "created_at": "INTEGER",
+    "version": "INTEGER",
+    "errorcode": "TEXT",
+    "host_merchant_id": "TEXT",
+    "transaction_filename_id": "TEXT",
+    "transaction_request_filename": "TEXT",
+}
+# st_request fields with their own column, named req_<field>
+REQUEST_COLUMNS = {
+    "sitereference": "TEXT",
+    "terminalid": "TEXT",
+    "maskedpan": "TEXT",
+    "mainamount": "REAL",
+    "errorcode": "TEXT",
+}
+INDEXES = ("id", "status", "timestamp", "transaction_filename_id", "transaction_request_filename", "errorcode",
+           "host_merchant_id", "req_sitereference", "req_terminalid", "req_maskedpan")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS records (
+    {", ".join(f"{column} {type}" for column, type in COLUMNS.items())},
+    {", ".join(f"req_{field} {type}" for field, type in REQUEST_COLUMNS.items())},
+    st_request TEXT,
+    body TEXT NOT NULL
+);
+{"".join(f"CREATE INDEX IF NOT EXISTS records_{column} ON records ({column});" for column in INDEXES)}
+"""
+_COMPARISONS = {"=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def isStore(path):
+    """Whether path is named as a SQLite result store."""
+    return str(path).endswith(STORE_EXTENSIONS)
+
+
+class ResultStore(Sequence):
+    """Query results kept in a local SQLite database, so a saved session opens instantly and never has to fit in RAM.
+    Behaves like the in memory ResultCache: a read only sequence of records with a filter method,
+    whose conditions are run as SQL against indexed columns.
+    Use create for a new store and load to open a saved one.
+    Unlike the cache, an attribute with its own column is only matched at the level that column reads it from 
+    (errorcode at both), and a missing value never contains anything."""
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    @classmethod
+    def create(cls, path):
+        """Start a new store, replacing any records already saved at path."""
+        store = cls(path)
+        store._db.executescript("DROP TABLE IF EXISTS records;" + _SCHEMA)
+        return store
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved store as it is."""
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return cls(path)
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        row = self._db.execute("SELECT body, st_request FROM records WHERE rowid = ?", (i + 1,)).fetchone()
+        if row is None:
+            raise IndexError("store index out of range")
+        return _record(row)
+
+    def __iter__(self):
+        for row in self._db.execute("SELECT body, st_request FROM records ORDER BY rowid"):
+            yield _record(row)
+
+    def insert(self, records, batchSize=BATCH_SIZE) -> int:
+        """Add records from any iterable, committing every batchSize. PAGE_END markers are skipped.
+        Returns the number of records added."""
+        count = 0
+        batch = []
+        for record in records:
+            if record == "PAGE_END":
+                continue
+            batch.append(_row(record))
+            if len(batch) == batchSize:
+                count += self._insert(batch)
+                batch = []
+        if batch:
+            count += self._insert(batch)
+        return count
+
+    def filter(self, filterDict):
+        """Returns the records matching every condition in filterDict, in insertion order, see predicates.
+        The conditions are run in SQLite, then checked exactly against each returned record."""
+        predicates = compileFilter(filterDict)
+        clauses, params = [], []
+        for predicate in predicates:
+            clause, clauseParams = _where(predicate)
+            clauses.append(clause)
+            params.extend(clauseParams)
+        sql = "SELECT body, st_request FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        res = []
+        for row in self._db.execute(sql + " ORDER BY rowid", params):
+            record = _record(row)
+            request = _request(row[1])
+            if all(p.matches(record, request) for p in predicates):
+                res.append(record)
+        return res
+
+    def close(self):
+        self._db.close()
+
+    # Private Methods ---------------------------------------------------------------
+    def _insert(self, rows):
+        placeholders = ", ".join("?" * len(rows[0]))
+        with self._db:
+            self._db.executemany(f"INSERT INTO records VALUES ({placeholders})", rows)
+        return len(rows)
+
+
+def _row(record):
+    """The column values for a record."""
+    row = []
+    for column in COLUMNS:
+        row.append(record.get(column))
+    request = _request(record.get("st_request"))
+    for field in REQUEST_COLUMNS:
+        value = request.get(field)
+        row.append(value if type(value) in (str, int, float) else None)  # Column affinity converts numeric strings
+    body = {k: v for k, v in record.items() if k != "st_request"}
+    row.append(record.get("st_request"))
+    row.append(json.dumps(body, default=str))
+    return row
+
+
+def _record(row):
+    record = json.loads(row[0])
+    if row[1] is not None:
+        record["st_request"] = row[1]
+    return record
+
+
+def _request(st_request):
+    try:
+        request = json.loads(st_request)
+    except (TypeError, ValueError):
+        return {}
+    return request if type(request) == dict else {}
+
+
+def _sources(key):
+    """SQL expressions for where a key's value lives, each with its column type (None if it is extracted from JSON)."""
+    sources = []
+    if key in COLUMNS:
+        sources.append((key, COLUMNS[key]))
+    if key in REQUEST_COLUMNS:
+        sources.append((f"req_{key}", REQUEST_COLUMNS[key]))
+    if sources:
+        return sources
+    path = json.dumps(key).replace("'", "''")
+    return [(f"json_extract(body, '$.{path}')", None),
+            (f"CASE WHEN json_valid(st_request) THEN json_extract(st_request, '$.{path}') END", None)]
+
+
+def _where(predicate):
+    """A WHERE clause (and its parameters) selecting at least every record the predicate matches.
+    Typed columns are compared directly so their indexes can be used."""
+    clauses, params = [], []
+    for source, type in _sources(predicate.key):
+        if predicate.op == "contains":
+            clauses.append(f"instr(CAST({source} AS TEXT), ?) > 0")
+            params.append(predicate.values[0])
+            continue
+        wanted = "REAL" if predicate.numeric else "TEXT"
+        if type is None or (type == "TEXT") != (wanted == "TEXT"):
+            source = f"CAST({source} AS {wanted})"
+        if predicate.op == "between":
+            clauses.append(f"{source} BETWEEN ? AND ?")
+        else:
+            clauses.append(f"{source} {_COMPARISONS[predicate.op]} ?")
+        params.extend(predicate.values)
+    return f"({' OR '.join(clauses)})", params
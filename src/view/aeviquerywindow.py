@@ -1,27 +1,230 @@
-from PySide6.QtWidgets import QGroupBox, QMainWindow, QTabWidget, QVBoxLayout
+import json
+import pprint
+from functools import partial
+
+from PySide6.QtWidgets import (QCheckBox, QComboBox, QFormLayout, QGroupBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit,
+                               QMainWindow, QPlainTextEdit, QProgressBar, QPushButton, QSpinBox, QTableView, QTabWidget,
+                               QVBoxLayout, QWidget)
+
+from view.queryworker import QueryWorker
+from view.resultsmodel import ResultsModel
+
+INDEXES = {"Status": "status", "Filename": "transaction_filename_id", "Id": "id", "Planned (filter only)": None}
+ROW_HEIGHT = 22  # Fixed, so the view never measures rows and 500k of them scroll smoothly
+
 
 class AeviQueryWindow(QMainWindow):
-    def __init__(self):
+    """Runs queries on a worker thread and streams their records into a lazily loaded table, see QueryWorker."""
+    def __init__(self, repo):
         super().__init__()
+        self.repo = repo
+        self.worker = None
         self.setWindowTitle("Aevi Query")
         self.resize(800, 600)
         self.setCentralWidget(self._tabWidget())
         self._indexSelection()
-        # self._filterSelection()
-        # self._resultsArea()
-        # self._cacheArea()
+        self._filterSelection()
+        self._resultsArea()
+        self._cacheArea()
         self.show()
 
+    def runQuery(self):
+        """Start the query described by the Query tab. Records are cached once the query has run to the end."""
+        index = INDEXES[self.indexSelectionComponents["Index"].currentText()]
+        values = [v.strip() for v in self.indexSelectionComponents["Index Value"].text().split(',') if v.strip()]
+        limit = self.indexSelectionComponents["Limit"].value()
+        useFilter = self.indexSelectionComponents["Apply Filter"].isChecked()
+        filterString = self.filterComponents["Filter"].text().strip() if useFilter else ""
+        projection = [a.strip() for a in self.filterComponents["Attributes"].text().split(',') if a.strip()] or None
+        if index is None:
+            if not filterString:
+                self.statusLabel.setText("A planned query needs a filter")
+                return
+            query = partial(self._plannedQuery, filterString, projection)
+        elif not values:
+            self.statusLabel.setText(f"Enter a value for {index}")
+            return
+        elif index == "status":
+            query = partial(self.repo.streamStatusQuery, values, filterString or None, projection=projection)
+        elif index == "id":
+            query = partial(self.repo.runBulkIdQuery, values, projection)
+        else:
+            query = partial(self.repo.runFilenamesQuery, values, None, projection)
+        if limit:
+            query = partial(_limit, query, limit)
+        self._start(query, done=lambda records: self.repo.setCache(records, projection, values if index == "status" else None))
+
+    def filterCache(self):
+        """Filter the cached records on the worker thread, "attribute: condition; attribute: condition"."""
+        filterDict = {}
+        for part in self.cacheComponents["Filter"].text().split(';'):
+            if ':' in part:
+                attr, condition = part.split(':', 1)
+                filterDict[attr.strip()] = condition.strip()
+        if not filterDict or len(self.repo.getCache()) == 0:
+            self.statusLabel.setText("Nothing to filter")
+            return
+        self._start(partial(self.repo.filterCache, filterDict))
+
+    def cancel(self):
+        if self.worker:
+            self.worker.cancel()
+            self.statusLabel.setText("Cancelling...")
+
+    # Private Methods ---------------------------------------------------------------
     def _tabWidget(self):
         tabWidget = QTabWidget()
-        tabs = ["Query", "Results","Cache"]
+        tabs = ["Query", "Results", "Cache"]
         self.tabs = {}
+        for name in tabs:
+            tab = QWidget()
+            tab.setLayout(QVBoxLayout())
+            tabWidget.addTab(tab, name)
+            self.tabs[name] = tab
+        self.tabWidget = tabWidget
         return tabWidget
 
     def _indexSelection(self):
         box = QGroupBox("Query Index")
-        layout = QVBoxLayout()
+        layout = QFormLayout()
         box.setLayout(layout)
         self.indexSelectionComponents = dict()
         labels = ["Index", "Index Value", "Limit", "Apply Filter"]
+        index = QComboBox()
+        index.addItems(list(INDEXES))
+        value = QLineEdit()
+        value.setPlaceholderText("Comma delimited, e.g. FAILED,RETRY")
+        limit = QSpinBox()
+        limit.setRange(0, 10**7)
+        limit.setSpecialValueText("No limit")
+        applyFilter = QCheckBox()
+        for label, widget in zip(labels, [index, value, limit, applyFilter]):
+            layout.addRow(label, widget)
+            self.indexSelectionComponents[label] = widget
+        self.tabs["Query"].layout().addWidget(box)
+
+    def _filterSelection(self):
+        box = QGroupBox("Filter")
+        layout = QFormLayout()
+        box.setLayout(layout)
+        self.filterComponents = {"Filter": QLineEdit(), "Attributes": QLineEdit()}
+        self.filterComponents["Filter"].setPlaceholderText("e.g. errorcode = 70000; terminalid = T0006205")
+        self.filterComponents["Attributes"].setPlaceholderText("Comma delimited, leave empty for whole records")
+        for label, widget in self.filterComponents.items():
+            layout.addRow(label, widget)
+        self.tabs["Query"].layout().addWidget(box)
+        self.runButton = QPushButton("Run")
+        self.runButton.clicked.connect(self.runQuery)
+        self.cancelButton = QPushButton("Cancel")
+        self.cancelButton.setEnabled(False)
+        self.cancelButton.clicked.connect(self.cancel)
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.runButton)
+        buttons.addWidget(self.cancelButton)
+        self.progressBar = QProgressBar()
+        self.progressBar.setRange(0, 1)
+        self.progressBar.setFormat("%v records")
+        self.statusLabel = QLabel()
+        self.statusLabel.setWordWrap(True)
+        self.tabs["Query"].layout().addLayout(buttons)
+        self.tabs["Query"].layout().addWidget(self.progressBar)
+        self.tabs["Query"].layout().addWidget(self.statusLabel)
+        self.tabs["Query"].layout().addStretch()
+
+    def _resultsArea(self):
+        self.resultsModel = ResultsModel()
+        table = QTableView()
+        table.setModel(self.resultsModel)
+        table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        table.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        table.setSelectionBehavior(QTableView.SelectRows)
+        table.selectionModel().currentRowChanged.connect(self._showRecord)
+        self.resultsTable = table
+        self.recordView = QPlainTextEdit()
+        self.recordView.setReadOnly(True)
+        self.tabs["Results"].layout().addWidget(table, 3)
+        self.tabs["Results"].layout().addWidget(self.recordView, 1)
+
+    def _cacheArea(self):
+        box = QGroupBox("Filter cached query")
+        layout = QFormLayout()
+        box.setLayout(layout)
+        self.cacheComponents = {"Filter": QLineEdit()}
+        self.cacheComponents["Filter"].setPlaceholderText("attribute: condition; ... e.g. sitereference: test_site; timestamp: > 1634000000")
+        layout.addRow("Filter", self.cacheComponents["Filter"])
+        self.filterButton = QPushButton("Filter")
+        self.filterButton.clicked.connect(self.filterCache)
+        layout.addRow(self.filterButton)
+        self.cacheLabel = QLabel("No cached query")
+        self.tabs["Cache"].layout().addWidget(box)
+        self.tabs["Cache"].layout().addWidget(self.cacheLabel)
+        self.tabs["Cache"].layout().addStretch()
+
+    def _start(self, query, done=None):
+        """Run query on a new worker, streaming its records into a cleared results table."""
+        self.resultsModel.clear()
+        self.recordView.clear()
+        self.worker = QueryWorker(query, done)
+        self.worker.page.connect(self.resultsModel.addRecords)
+        self.worker.progress.connect(self._progress)
+        self.worker.message.connect(self.statusLabel.setText)
+        self.worker.finished.connect(self._finished)
+        self.worker.failed.connect(self._failed)
+        self._setRunning(True)
+        self.statusLabel.setText("Querying...")
+        self.worker.start()
+
+    def _plannedQuery(self, filterString, projection):
+        """Runs on the worker thread, since planning connects to DynamoDB and describes the table the first time."""
+        self.worker.message.emit(self.repo.explainQuery(filterString).splitlines()[0])
+        yield from self.repo.runPlannedQuery(filterString, projection)
+
+    def _setRunning(self, running):
+        self.runButton.setEnabled(not running)
+        self.filterButton.setEnabled(not running)
+        self.cancelButton.setEnabled(running)
+        self.progressBar.setRange(0, 0 if running else max(1, len(self.resultsModel)))
+        if not running:
+            self.progressBar.setValue(len(self.resultsModel))
+
+    def _progress(self, count):
+        self.statusLabel.setText(f"{count} records so far...")
+
+    def _finished(self, count, cancelled):
+        self._setRunning(False)
+        stats = self.repo.lastStats.summary() if self.repo.lastStats else ""
+        self.statusLabel.setText(f"{'Cancelled after' if cancelled else 'Found'} {count} records. {stats}")
+        self.cacheLabel.setText(f"{len(self.repo.getCache())} records cached")
+        self.worker.thread.wait()
+        self.worker = None
+
+    def _failed(self, message):
+        self._setRunning(False)
+        self.statusLabel.setText(f"Query failed: {message}")
+        self.worker.thread.wait()
+        self.worker = None
+
+    def _showRecord(self, current, previous):
+        if not current.isValid():
+            return
+        record = dict(self.resultsModel.record(current.row()))
+        if "st_request" in record:
+            try:
+                record["st_request"] = json.loads(record["st_request"])
+            except ValueError:
+                pass
+        self.recordView.setPlainText(pprint.pformat(record))
+
 
+def _limit(query, limit):
+    """Yields at most limit records of a query, closing it when done so its threads stop."""
+    results = iter(query())
+    try:
+        for i, record in enumerate(results):
+            if i >= limit:
+                return
+            yield record
+    finally:
+        if hasattr(results, "close"):
+            results.close()
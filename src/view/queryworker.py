@@ -0,0 +1,73 @@
+import threading
+
+from PySide6.QtCore import QObject, QThread, Signal
+
+PAGE_SIZE = 500  # Records sent to the UI thread at a time
+
+
+class QueryWorker(QObject):
+    """Runs a query (any callable returning an iterable of records, e.g. one of AeviRepo's generators) on its own
+    QThread and sends the records back in pages, so the window never waits on DynamoDB or on filtering the cache.
+    Cancelling stops at the next record and closes the generator, which stops the repo's query threads."""
+    page = Signal(list)
+    progress = Signal(int)
+    message = Signal(str)  # A line for the status bar from the query itself, e.g. the plan it chose
+    finished = Signal(int, bool)  # Records sent, whether the query was cancelled
+    failed = Signal(str)
+
+    def __init__(self, query, done=None):
+        """done is called on the worker thread with every record once the query has finished without being cancelled."""
+        super().__init__()
+        self._query = query
+        self._done = done
+        self._cancelled = threading.Event()
+        self.count = 0
+        self.thread = QThread()
+        self.moveToThread(self.thread)
+        self.thread.started.connect(self.run)
+        self.finished.connect(self.thread.quit)
+        self.failed.connect(self.thread.quit)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        self.count = 0
+        records = [] if self._done else None
+        page = []
+        results = None
+        try:
+            results = iter(self._query())
+            for record in results:
+                if self._cancelled.is_set():
+                    break
+                if record == "PAGE_END":
+                    continue
+                page.append(record)
+                if len(page) == PAGE_SIZE:
+                    self._send(page, records)
+                    page = []
+            if page and not self._cancelled.is_set():
+                self._send(page, records)
+            if self._done and not self._cancelled.is_set():
+                self._done(records)
+        except Exception as e:
+            print(e)
+            self.failed.emit(str(e))
+            return
+        finally:
+            if hasattr(results, "close"):
+                results.close()
+        self.finished.emit(self.count, self._cancelled.is_set())
+
+    # Private Methods ---------------------------------------------------------------
+    def _send(self, page, records):
+        """Hand a page to the UI thread. records collects every page when there is a done callback to give them to."""
+        if records is not None:
+            records.extend(page)
+        self.count += len(page)
+        self.page.emit(page)
+        self.progress.emit(self.count)
@@ -0,0 +1,61 @@
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+COLUMNS = ("id", "status", "timestamp", "errorcode", "errormessage", "host_merchant_id", "transaction_filename_id")
+FETCH_SIZE = 1000  # Rows the view is given at a time as it scrolls to the bottom
+
+
+class ResultsModel(QAbstractTableModel):
+    """Records for a QTableView. Pages of records are added as a query streams them in, but the view only learns
+    about FETCH_SIZE more rows each time it scrolls to the bottom (fetchMore), so adding 500k records stays cheap
+    and the view only ever asks for the cells on screen."""
+    def __init__(self, columns=COLUMNS, parent=None):
+        super().__init__(parent)
+        self._columns = list(columns)
+        self._records = []
+        self._shown = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._shown
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        value = self._records[index.row()].get(self._columns[index.column()])
+        return None if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        return self._columns[section] if orientation == Qt.Horizontal else section + 1
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._shown < len(self._records)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(FETCH_SIZE, len(self._records) - self._shown)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._shown, self._shown + count - 1)
+        self._shown += count
+        self.endInsertRows()
+
+    def addRecords(self, records):
+        """Add a page of records. The view is only told about them straight away while it has less than a screenful."""
+        self._records.extend(r for r in records if r != "PAGE_END")
+        if self._shown < FETCH_SIZE:
+            self.fetchMore()
+
+    def clear(self):
+        self.beginResetModel()
+        self._records = []
+        self._shown = 0
+        self.endResetModel()
+
+    def record(self, row):
+        return self._records[row]
+
+    def __len__(self):
+        return len(self._records)
@@ -2,7 +2,12 @@
 from decimal import Decimal
 import pytest
 import uuid
+import json
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import Binary
 import src.aevirepo as aevi
+from src.checkpoint import Checkpoint
+from src.resultfile import readRecords
 import localstack_client.session as boto3
 from moto import mock_dynamodb2
 from dotenv import load_dotenv
@@ -267,3 +272,538 @@ def test_runFilteredQuery_stRequestAttr(repo: aevi.AeviRepo):
     result = repo.runFilteredStatusQuery(["FAILED"], filterString)
     assert all(result) == all(expected)
 
+
+@pytest.fixture(scope="module")
+def sortedRepo(repo: aevi.AeviRepo):
+    """Same records in a table whose status index is sorted by timestamp. Runs inside the repo fixture's mock."""
+    sortedRepo = aevi.AeviRepo(local=repo.isLocal)
+    if sortedRepo.isLocal:
+        cl = boto3.client('dynamodb', region_name="eu-west-1")
+        if "sorted-aevi-Transaction" in cl.list_tables()['TableNames']:
+            cl.delete_table(TableName="sorted-aevi-Transaction")
+    table = sortedRepo._conn.create_table(
+        TableName='sorted-aevi-Transaction',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'status', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'N'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'status',
+                'KeySchema': [
+                    {'AttributeName': 'status', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'},
+                ],
+                'ProvisionedThroughput': {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1},
+                'Projection': {'ProjectionType': 'ALL'},
+            },
+        ],
+        ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+    )
+    for item in RECORDS:
+        table.put_item(Item=item)
+    sortedRepo.setTable("sorted-aevi-Transaction")
+    yield sortedRepo
+
+def test_runStatusQuery_concurrent(repo: aevi.AeviRepo):
+    res = repo.runStatusQuery(["FAILED", "SUCCESS"], concurrent=True)
+    assert sorted(r["id"] for r in res) == sorted(r["id"] for r in RECORDS)
+    assert all(type(r["timestamp"]) == int for r in res)
+
+def test_streamStatusQuery_grouped(repo: aevi.AeviRepo):
+    res = list(repo.streamStatusQuery(["SUCCESS", "FAILED"], ordering="grouped"))
+    assert [r["status"] for r in res] == ["FAILED"] * len(RECORDS)
+
+def test_streamStatusQuery_filtered(repo: aevi.AeviRepo):
+    res = list(repo.streamStatusQuery(["FAILED"], "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"))
+    assert [r["id"] for r in res] == [r["id"] for r in RECORDS if 1633824000 <= r["timestamp"] <= 1634256000]
+
+def test_streamStatusQuery_filteredRequests(repo: aevi.AeviRepo):
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append(kwargs)
+    repo.addHook(hook)
+    res = list(repo.streamStatusQuery(["FAILED"], "errorcode = 30000"))
+    groups = repo.aggregateStatusQuery(["FAILED"], "status", "errorcode = 30000")
+    repo.removeHook(hook)
+    assert len(res) == groups["FAILED"].count == len(RECORDS)
+    assert len(calls) == 2
+    assert all("Limit" not in c for c in calls)
+
+def test_streamStatusQuery_badOrdering(repo: aevi.AeviRepo):
+    with pytest.raises(ValueError):
+        list(repo.streamStatusQuery(["FAILED"], ordering="sorted"))
+
+def test_streamStatusQuery_partitions(sortedRepo: aevi.AeviRepo):
+    assert len(sortedRepo._statusPartitions("FAILED", 3)) == 3
+    res = list(sortedRepo.streamStatusQuery(["FAILED"], partitions=3))
+    assert sorted(r["id"] for r in res) == sorted(r["id"] for r in RECORDS)
+
+def test_streamStatusQuery_partitionsWithoutSortKey(repo: aevi.AeviRepo):
+    assert repo._statusPartitions("FAILED", 3) == [None]
+
+def test_countStatusQuery(repo: aevi.AeviRepo):
+    counts = repo.countStatusQuery(["FAILED", "SUCCESS"])
+    assert counts["Count"] == len(RECORDS)
+    assert counts["statuses"]["FAILED"]["Count"] == len(RECORDS)
+    assert counts["statuses"]["SUCCESS"]["Count"] == 0
+
+def test_countStatusQuery_filtered(repo: aevi.AeviRepo):
+    counts = repo.countStatusQuery(["FAILED"], "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00")
+    assert counts["Count"] == len([r for r in RECORDS if 1633824000 <= r["timestamp"] <= 1634256000])
+    assert counts["ScannedCount"] == len(RECORDS)
+
+def test_runFilteredStatusQuery_pageSize(repo: aevi.AeviRepo):
+    filterString = "errormessage = Invalid field"
+    result = list(repo.runFilteredStatusQuery(["FAILED"], filterString, limit=100, pageSize=2))
+    assert [i if i == "PAGE_END" else "ITEM" for i in result] == ["ITEM", "ITEM", "PAGE_END", "ITEM", "PAGE_END"]
+
+def test_runFilteredStatusQuery_prefetch(repo: aevi.AeviRepo):
+    filterString = "errormessage contains Invalid"
+    expected = list(repo.runFilteredStatusQuery(["FAILED"], filterString))
+    result = list(repo.runFilteredStatusQuery(["FAILED"], filterString, prefetch=2))
+    assert result == expected
+    assert result.count("PAGE_END") == len(RECORDS)
+
+# moto ignores Segment/TotalSegments and returns the whole table for every segment, so scans use one segment
+def test_streamScan(repo: aevi.AeviRepo):
+    res = list(repo.streamScan(segments=1))
+    assert sorted(r["id"] for r in res) == sorted(r["id"] for r in RECORDS)
+
+def test_streamScan_filterAndProjection(repo: aevi.AeviRepo):
+    res = list(repo.streamScan("errormessage contains Invalid; version = 7", ["id", "status"], segments=1))
+    assert sorted(res, key=lambda r: r["id"]) == sorted(({"id": r["id"], "status": r["status"]} for r in RECORDS), key=lambda r: r["id"])
+
+def test_runScan_fileSink(repo: aevi.AeviRepo, tmp_path):
+    path = tmp_path / "scan.ndjson"
+    with open(path, "w") as fp:
+        count = repo.runScan(fp, segments=1)
+    lines = [json.loads(line) for line in open(path)]
+    assert count == len(lines) == len(RECORDS)
+
+def test_runScan_callableSink(repo: aevi.AeviRepo):
+    res = []
+    assert repo.runScan(res.append, "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00", segments=1) == len(res)
+    assert [r["id"] for r in res] == [r["id"] for r in RECORDS if 1633824000 <= r["timestamp"] <= 1634256000]
+
+def test_storeStatusQuery(repo: aevi.AeviRepo, tmp_path):
+    store = aevi.ResultStore.create(str(tmp_path / "results.db"))
+    assert repo.storeStatusQuery(store, ["FAILED"]) == len(RECORDS)
+    repo.setCache(store)
+    assert repo.getCache() is store
+    assert [r["id"] for r in repo.filterCache({"sitereference": "test_site"})] == [RECORDS[1]["id"]]
+
+def test_runBulkIdQuery(repo: aevi.AeviRepo):
+    ids = [r["id"] for r in RECORDS] + [" " + RECORDS[0]["id"], "missing", ""]
+    res = list(repo.runBulkIdQuery(ids))
+    assert sorted(r["id"] for r in res) == sorted(r["id"] for r in RECORDS)
+    assert all(type(r["version"]) == int for r in res)
+
+def test_runBulkIdQuery_chunks(repo: aevi.AeviRepo, monkeypatch):
+    monkeypatch.setattr(aevi, "BATCH_GET_SIZE", 2)
+    res = list(repo.runBulkIdQuery([r["id"] for r in RECORDS]))
+    assert len(res) == len(RECORDS)
+
+def test_runBulkIdQuery_unprocessed(repo: aevi.AeviRepo, monkeypatch):
+    calls = []
+    def batch_get_item(RequestItems, **kwargs):
+        keys = RequestItems["prod-aevi-Transaction"]["Keys"]
+        calls.append(keys)
+        item = dict(aevi._serialiseKey(RECORDS[0]), **keys[0])
+        res = {"Responses": {"prod-aevi-Transaction": [item]}}
+        if len(keys) > 1:
+            res["UnprocessedKeys"] = {"prod-aevi-Transaction": {"Keys": keys[1:]}}
+        return res
+    monkeypatch.setattr(repo._client, "batch_get_item", batch_get_item)
+    monkeypatch.setattr(aevi, "RETRY_BASE", 0)
+    res = list(repo.runBulkIdQuery(["a", "b", "c"]))
+    assert [r["id"] for r in res] == ["a", "b", "c"]
+    assert [len(keys) for keys in calls] == [3, 2, 1]
+
+@pytest.fixture
+def fileRecords(repo: aevi.AeviRepo):
+    """Records in two files, with a status no other test queries."""
+    records = [dict(RECORDS[i % len(RECORDS)], id=f"file{i}", status="ARCHIVED", transaction_filename_id=f"file{i % 2}")
+               for i in range(5)]
+    for item in records:
+        repo._table.put_item(Item=item)
+    yield records
+    for item in records:
+        repo._table.delete_item(Key={"id": item["id"]})
+
+def test_runFilenameQuery_paginated(repo: aevi.AeviRepo, fileRecords):
+    res = repo.runFilenameQuery(" file0 ")
+    assert sorted(r["id"] for r in res) == ["file0", "file2", "file4"]
+    assert all(type(r["timestamp"]) == int for r in res)
+
+def test_runFilenamesQuery(repo: aevi.AeviRepo, fileRecords):
+    counts = {}
+    res = list(repo.runFilenamesQuery(["file0", "file1", "file2", "file0"], counts))
+    assert sorted(r["id"] for r in res) == sorted(r["id"] for r in fileRecords)
+    assert counts == {"file0": 3, "file1": 2, "file2": 0}
+
+def test_projection_statusQuery(repo: aevi.AeviRepo):
+    res = repo.runStatusQuery(["FAILED"], projection=["errorcode", "timestamp"])
+    assert sorted(res, key=lambda r: r["id"]) == sorted(({k: r[k] for k in ("id", "status", "errorcode", "timestamp")} for r in RECORDS),
+                                                        key=lambda r: r["id"])
+
+def test_projection_filteredStatusQuery(repo: aevi.AeviRepo):
+    res = [i for i in repo.runFilteredStatusQuery(["FAILED"], "errormessage contains Invalid", projection=["timestamp"]) if i != "PAGE_END"]
+    assert len(res) == len(RECORDS)
+    assert all(set(r) == {"id", "status", "timestamp"} for r in res)
+
+def test_projection_idAndFilename(repo: aevi.AeviRepo, fileRecords):
+    assert repo.runIdQuery(RECORDS[0]["id"], ["status"]) == [{"id": RECORDS[0]["id"], "status": "FAILED"}]
+    assert list(repo.runBulkIdQuery([RECORDS[0]["id"]], ["version"])) == [{"id": RECORDS[0]["id"], "version": 7}]
+    res = repo.runFilenameQuery("file1", ["status"])
+    assert all(set(r) == {"id", "transaction_filename_id", "status"} for r in res)
+
+def test_projection_cacheFetchesMissing(repo: aevi.AeviRepo):
+    projection = ["timestamp"]
+    repo.setCache(repo.runStatusQuery(["FAILED"], projection=projection), projection)
+    stats = repo.lastStats
+    cache = repo.getCache()
+    assert cache.has("timestamp") and not cache.has("sitereference")
+    res = repo.filterCache({"timestamp": "> 1634000000", "sitereference": "test_site"})
+    assert [r["id"] for r in res] == [RECORDS[1]["id"]]
+    assert res[0]["st_request"] == RECORDS[1]["st_request"]
+    assert len(cache._complete) == 2
+    assert repo.lastStats is stats and stats.name == "status FAILED"
+
+class ThrottlingClient():
+    """Wraps a client, throttling the listed calls to query."""
+    def __init__(self, client, throttle):
+        self._client = client
+        self.throttle = throttle
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def query(self, **kwargs):
+        self.calls.append(dict(kwargs))
+        if len(self.calls) in self.throttle:
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "Query")
+        return self._client.query(**kwargs)
+
+def test_throttlingResumesInPlace(repo: aevi.AeviRepo, monkeypatch):
+    client = ThrottlingClient(repo._client, throttle=[2, 3])
+    monkeypatch.setattr(repo, "_client", client)
+    monkeypatch.setattr(aevi, "RETRY_BASE", 0)
+    repo.setRateLimit(1000)
+    try:
+        res = [i for i in repo.runFilteredStatusQuery(["FAILED"], "errormessage contains Invalid") if i != "PAGE_END"]
+    finally:
+        repo.setRateLimit(None)
+    assert len(res) == len(RECORDS)
+    assert client.calls[1]["ExclusiveStartKey"] == client.calls[2]["ExclusiveStartKey"] == client.calls[3]["ExclusiveStartKey"]
+    assert all(c["ReturnConsumedCapacity"] == "TOTAL" for c in client.calls)
+
+def test_throttlingGivesUp(repo: aevi.AeviRepo, monkeypatch):
+    monkeypatch.setattr(repo, "_client", ThrottlingClient(repo._client, throttle=range(100)))
+    monkeypatch.setattr(aevi, "RETRY_BASE", 0)
+    with pytest.raises(ClientError):
+        repo.runStatusQuery(["FAILED"])
+
+def test_rateLimitConsumesCapacity(repo: aevi.AeviRepo):
+    repo.setRateLimit(1000)
+    try:
+        repo.runStatusQuery(["FAILED"], concurrent=True)
+        assert repo.getRateLimiter().consumed > 0
+    finally:
+        repo.setRateLimit(None)
+
+def test_lastStats(repo: aevi.AeviRepo):
+    list(repo.runFilteredStatusQuery(["FAILED"], "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00", limit=100))
+    stats = repo.lastStats
+    assert stats.count == 1
+    assert stats.scannedCount >= len(RECORDS)
+    assert stats.pages == len(stats.latencies) >= 1
+    assert stats.bytes > 0 or stats.unsizedPages == stats.pages  # Moto sends no content-length
+
+def test_hooks(repo: aevi.AeviRepo):
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append((operation, kwargs.get("IndexName")))
+    repo.addHook(hook)
+    try:
+        repo.runIdQuery(RECORDS[0]["id"])
+        repo.runFilenameQuery("file0")
+    finally:
+        repo.removeHook(hook)
+    assert calls == [("query", None), ("query", "transaction_filename_id")]
+    assert repo.lastStats.name == "filename file0"
+
+@pytest.fixture(scope="module")
+def fastRepo(repo: aevi.AeviRepo):
+    """The same table through the low-level client fast path. Runs inside the repo fixture's mock."""
+    fastRepo = aevi.AeviRepo(local=repo.isLocal, fastPath=True)
+    fastRepo.setTable("prod-aevi-Transaction")
+    yield fastRepo
+
+def test_fastPath_identicalRecords(repo: aevi.AeviRepo, fastRepo: aevi.AeviRepo):
+    byId = lambda records: sorted(records, key=lambda r: r["id"])
+    assert byId(fastRepo.runStatusQuery(["FAILED"])) == byId(repo.runStatusQuery(["FAILED"])) == byId(RECORDS)
+    assert fastRepo.runIdQuery(RECORDS[0]["id"]) == repo.runIdQuery(RECORDS[0]["id"]) == [RECORDS[0]]
+    ids = [r["id"] for r in RECORDS]
+    assert byId(fastRepo.runBulkIdQuery(ids, ["version"])) == byId(repo.runBulkIdQuery(ids, ["version"]))
+    assert byId(fastRepo.streamScan(segments=1)) == byId(repo.streamScan(segments=1))
+    assert all(type(r["timestamp"]) == int for r in fastRepo.runStatusQuery(["FAILED"]))
+
+def test_fastPath_filtered(repo: aevi.AeviRepo, fastRepo: aevi.AeviRepo):
+    for filterString in ["errormessage contains Invalid", "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"]:
+        fast = list(fastRepo.runFilteredStatusQuery(["FAILED"], filterString, projection=["timestamp"]))
+        assert fast == list(repo.runFilteredStatusQuery(["FAILED"], filterString, projection=["timestamp"]))
+    assert fastRepo.countStatusQuery(["FAILED"], "errorcode = 30000")["Count"] == len(RECORDS)
+
+def test_fastItem():
+    item = {"s": {"S": "x"}, "n": {"N": "7"}, "f": {"N": "1.5"}, "e": {"N": "1E+2"}, "b": {"BOOL": False}, "z": {"NULL": True},
+            "m": {"M": {"n": {"N": "2"}}}, "l": {"L": [{"S": "a"}, {"N": "3"}]}, "ss": {"SS": ["a", "b"]}, "ns": {"NS": ["1"]}}
+    assert aevi._fastItem(item) == {"s": "x", "n": 7, "f": 1.5, "e": 100, "b": False, "z": None, "m": {"n": 2}, "l": ["a", 3],
+                                    "ss": {"a", "b"}, "ns": {1}}
+    assert aevi._fastItem({"bin": {"B": b"\x00"}, "bs": {"BS": [b"a"]}}) == {"bin": Binary(b"\x00"), "bs": {Binary(b"a")}}
+    assert aevi._serialise(Decimal(3)) == aevi._serialise(3) == {"N": "3"}
+
+def test_queryCache(repo: aevi.AeviRepo):
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append(operation)
+    repo.addHook(hook)
+    repo.setQueryCache(60)
+    try:
+        first = repo.runStatusQuery(["FAILED"])
+        requests = len(calls)
+        assert repo.runStatusQuery([" FAILED"], concurrent=True) == first
+        filtered = list(repo.runFilteredStatusQuery(["FAILED"], "errorcode = 30000", limit=100))
+        assert list(repo.runFilteredStatusQuery(["FAILED"], "errorcode = 30000", limit=100)) == filtered
+        assert repo.countStatusQuery(["FAILED"]) == repo.countStatusQuery(["FAILED"])
+        assert len(calls) == requests * 3
+        assert repo.getQueryCache().hits == 3
+        repo.getQueryCache().invalidate()
+        repo.runStatusQuery(["FAILED"])
+        assert len(calls) == requests * 4
+    finally:
+        repo.removeHook(hook)
+        repo.setQueryCache(None)
+
+def test_queryCache_streamingNotMemoised(repo: aevi.AeviRepo, tmp_path):
+    repo.setQueryCache(60)
+    try:
+        assert len(list(repo.streamStatusQuery(["FAILED"]))) == len(RECORDS)
+        repo.aggregateStatusQuery(["FAILED"], "status")
+        repo.storeStatusQuery(aevi.ResultStore.create(str(tmp_path / "results.db")), ["FAILED"])
+        assert len(repo.getQueryCache()) == 0
+    finally:
+        repo.setQueryCache(None)
+
+def test_queryCache_tooBig(repo: aevi.AeviRepo):
+    repo.setQueryCache(60, maxBytes=1000)
+    try:
+        assert len(repo.runStatusQuery(["FAILED"])) == len(RECORDS)
+        assert len(repo.getQueryCache()) == 0
+        assert repo.countStatusQuery(["FAILED"])["Count"] == len(RECORDS)
+        assert len(repo.getQueryCache()) == 1
+    finally:
+        repo.setQueryCache(None)
+
+def test_queryCache_perTable(repo: aevi.AeviRepo, sortedRepo: aevi.AeviRepo):
+    other = aevi.AeviRepo(local=repo.isLocal)
+    other.setQueryCache(60)
+    other.setTable("prod-aevi-Transaction")
+    assert len(other.runStatusQuery(["FAILED"])) == len(RECORDS)
+    other.setTable(sortedRepo._tableName)
+    assert other.runStatusQuery(["FAILED"]) == sortedRepo.runStatusQuery(["FAILED"])
+    assert len(other.getQueryCache()) == 2
+
+@pytest.mark.parametrize("fixture", ["repo", "sortedRepo"])
+def test_refreshCache(fixture, request):
+    repo = request.getfixturevalue(fixture)
+    repo.setCache(repo.runStatusQuery(["FAILED"]), statuses=["FAILED"])
+    newest = max(r["timestamp"] for r in RECORDS)
+    changes = [
+        dict(RECORDS[0], id="refresh-new", timestamp=newest + 60),
+        dict(RECORDS[0], timestamp=newest + 30, version=8),
+        dict(RECORDS[1], status="SUCCESS", version=8),
+    ]
+    for item in changes:
+        repo._table.put_item(Item=item)
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append(dict(kwargs))
+    repo.addHook(hook)
+    try:
+        assert repo.refreshCache() == {"added": 1, "updated": 1, "dropped": 0}
+        queries = list(calls)
+        assert not any("RequestItems" in c for c in queries)  # No recheck unless asked for
+        assert repo.lastStats.count == 2
+        if fixture == "sortedRepo":  # Moto reports ScannedCount before the range condition, so check the request
+            assert all("BETWEEN" in c["KeyConditionExpression"] and "FilterExpression" not in c for c in queries)
+        else:
+            assert all("FilterExpression" in c for c in queries)
+        cache = repo.getCache()
+        assert len(cache) == len(RECORDS) + 1
+        assert [r["version"] for r in cache if r["id"] == RECORDS[0]["id"]] == [8]
+        assert RECORDS[1]["id"] in [r["id"] for r in cache]  # Moved to SUCCESS without a newer timestamp
+        assert repo.refreshCache(recheck=True) == {"added": 0, "updated": 0, "dropped": 1}
+        assert sorted(r["id"] for r in repo.getCache()) == sorted([RECORDS[0]["id"], RECORDS[2]["id"], "refresh-new"])
+        repo._table.put_item(Item=dict(RECORDS[2], status="SUCCESS", version=8))
+        calls.clear()
+        assert repo.refreshCache(recheck=True) == {"added": 0, "updated": 0, "dropped": 1}
+        assert any("RequestItems" in c for c in calls)  # The recheck
+        assert sorted(r["id"] for r in repo.getCache()) == sorted([RECORDS[0]["id"], "refresh-new"])
+    finally:
+        repo.removeHook(hook)
+        repo._table.delete_item(Key={"id": "refresh-new"})
+        for item in RECORDS:
+            repo._table.put_item(Item=item)
+        repo.setCache([])
+
+def test_refreshCache_notAStatusQuery(repo: aevi.AeviRepo):
+    repo.setCache(RECORDS)
+    with pytest.raises(ValueError):
+        repo.refreshCache()
+    repo.setCache([])
+
+def test_aggregateCache(repo: aevi.AeviRepo):
+    with pytest.raises(aevi.EmptyCacheError):
+        repo.aggregateCache("status")
+    repo.setCache(RECORDS)
+    assert repo.aggregateCache("host_device_id")["T0000561"].count == 2
+    assert list(repo.aggregateCache("status", {"mainamount": "> 18"})) == ["FAILED"]
+    repo.setCache([])
+
+def test_aggregateStatusQuery(repo: aevi.AeviRepo):
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append(kwargs)
+    repo.addHook(hook)
+    groups = repo.aggregateStatusQuery(["FAILED"], "currencyiso3a")
+    repo.removeHook(hook)
+    assert {k: g.count for k, g in groups.items()} == {"EUR": 1, None: 2}
+    assert groups["EUR"].amount == 18.25
+    assert set(calls[0]["ExpressionAttributeNames"].values()) >= {"timestamp", "st_request"}
+    assert len(repo.getCache()) == 0
+
+def _onePerPage(repo, monkeypatch):
+    """Make status queries fetch one item per request, so they have pages to stop between."""
+    statusKwargs = repo._statusKwargs
+    monkeypatch.setattr(repo, "_statusKwargs", lambda *args: dict(statusKwargs(*args), Limit=1))
+
+def test_checkpointStatusQuery_resume(repo: aevi.AeviRepo, monkeypatch, tmp_path):
+    _onePerPage(repo, monkeypatch)
+    path = str(tmp_path / "query.ndjson")
+    calls = []
+    def hook(operation, kwargs, res, seconds):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ConnectionError("dropped")
+    repo.addHook(hook)
+    first = []
+    with pytest.raises(ConnectionError):
+        for record in repo.checkpointStatusQuery(["FAILED"], path):
+            first.append(record)
+    repo.removeHook(hook)
+    assert len(first) == 1
+    rest = list(repo.resumeStatusQuery(path))
+    assert sorted(r["id"] for r in first + rest) == sorted(r["id"] for r in RECORDS)
+    assert sorted(r["id"] for r in readRecords(path)) == sorted(r["id"] for r in RECORDS)
+    assert list(repo.resumeStatusQuery(path)) == []
+
+def test_resumeStatusQuery_skipsSavedRecords(repo: aevi.AeviRepo, monkeypatch, tmp_path):
+    """Records written without the state that points past them are fetched again, but not kept twice."""
+    _onePerPage(repo, monkeypatch)
+    path = str(tmp_path / "query.ndjson")
+    saveState = Checkpoint._saveState
+    saves = []
+    def failingSave(self):
+        saves.append(1)
+        if len(saves) == 3:
+            raise OSError("disk full")
+        saveState(self)
+    monkeypatch.setattr(Checkpoint, "_saveState", failingSave)
+    with pytest.raises(OSError):
+        list(repo.checkpointStatusQuery(["FAILED"], path, projection=["timestamp"]))
+    monkeypatch.setattr(Checkpoint, "_saveState", saveState)
+    assert len(list(readRecords(path))) == 2
+    assert len(list(repo.resumeStatusQuery(path))) == 1
+    ids = [r["id"] for r in readRecords(path)]
+    assert sorted(ids) == sorted(r["id"] for r in RECORDS)
+    assert all(set(r) == {"id", "status", "timestamp"} for r in readRecords(path))
+
+def test_resumeStatusQuery_otherTable(repo: aevi.AeviRepo, tmp_path):
+    path = str(tmp_path / "query.ndjson")
+    Checkpoint.create(path, "other-table", ["FAILED"])
+    with pytest.raises(ValueError):
+        list(repo.resumeStatusQuery(path))
+
+def test_splitFilterString():
+    expression, checks = aevi.splitFilterString("errorcode = 30000; terminalid = T0006205; mainamount = 18.25")
+    assert [(p.key, p.op, p.values) for p in checks] == [("terminalid", "=", ("T0006205",)), ("mainamount", "=", (18.25,))]
+    assert expression.get_expression()["operator"] == "AND"
+    assert aevi.splitFilterString("errormessage contains Invalid")[1] == []
+
+def test_stRequestFilter_statusQuery(repo: aevi.AeviRepo):
+    res = [i for i in repo.runFilteredStatusQuery(["FAILED"], "sitereference contains siteref", limit=100) if i != "PAGE_END"]
+    assert [r["id"] for r in res] == [RECORDS[0]["id"]]
+    res = [i for i in repo.runFilteredStatusQuery(["FAILED"], "terminalid = T0006205; errorcode = 30000", limit=100) if i != "PAGE_END"]
+    assert [r["id"] for r in res] == [RECORDS[0]["id"]]
+    assert repo.lastStats.count == 1  # Only what passed the contains(st_request, ...) prefilter was transferred
+    assert list(repo.streamStatusQuery(["FAILED"], "sitereference = siteref4567")) == []
+    assert [r["id"] for r in repo.streamStatusQuery(["FAILED"], "maskedpan contains ******1000")] == [RECORDS[0]["id"]]
+
+def test_stRequestFilter_projection(repo: aevi.AeviRepo):
+    res = list(repo.streamStatusQuery(["FAILED"], "sitereference contains test_site", projection=["timestamp"]))
+    assert res == [{"id": RECORDS[1]["id"], "status": "FAILED", "timestamp": RECORDS[1]["timestamp"]}]
+    res = list(repo.streamScan("sitereference contains test_site", ["st_request"], segments=1))
+    assert res == [{"id": RECORDS[1]["id"], "st_request": RECORDS[1]["st_request"]}]
+
+def test_stRequestFilter_count(repo: aevi.AeviRepo):
+    counts = repo.countStatusQuery(["FAILED"], "sitereference contains site")
+    assert counts["Count"] == 2
+    assert counts["statuses"]["FAILED"]["Count"] == 2
+
+def test_runPlannedQuery(repo: aevi.AeviRepo, fileRecords):
+    assert [r["id"] for r in repo.runPlannedQuery(f"id = {RECORDS[0]['id']}, missing; errorcode = 30000")] == [RECORDS[0]["id"]]
+    res = list(repo.runPlannedQuery("filename = file0; status = ARCHIVED,FAILED; errormessage contains Invalid"))
+    assert sorted(r["id"] for r in res) == ["file0", "file2", "file4"]
+    res = list(repo.runPlannedQuery("filename = file0; status = FAILED,SUCCESS", ["timestamp"]))
+    assert res == []
+    res = list(repo.runPlannedQuery("sitereference contains test_site", segments=1))
+    assert sorted(r["id"] for r in res) == sorted([RECORDS[1]["id"], "file1", "file4"])
+    assert repo.lastStats.name == "Scan the table filtered by sitereference contains test_site"
+
+def test_runPlannedQuery_numericTimeRange(repo: aevi.AeviRepo):
+    res = list(repo.runPlannedQuery("status = FAILED; between 1633824000 and 1634256000"))
+    assert [r["id"] for r in res] == [RECORDS[2]["id"]]
+    with pytest.raises(ValueError):
+        repo.explainQuery("status = FAILED; between yesterday and now")
+
+def test_runPlannedQuery_sortKey(sortedRepo: aevi.AeviRepo):
+    filterString = "status = FAILED; between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"
+    assert "timestamp between 1633824000 and 1634256000" in sortedRepo.explainQuery(filterString)
+    calls = []
+    hook = lambda operation, kwargs, res, seconds: calls.append(kwargs)
+    sortedRepo.addHook(hook)
+    try:
+        res = list(sortedRepo.runPlannedQuery(filterString, ["errorcode"]))
+    finally:
+        sortedRepo.removeHook(hook)
+    assert res == [{"id": RECORDS[2]["id"], "status": "FAILED", "errorcode": "30000"}]
+    assert ["FilterExpression" in c for c in calls] == [False]
+
+def test_queriesOnlyUseClient(repo: aevi.AeviRepo, monkeypatch):
+    """Resources aren't thread-safe, so the query workers must never touch one."""
+    other = aevi.AeviRepo(local=repo.isLocal)
+    other.setTable("prod-aevi-Transaction")
+    monkeypatch.setattr(aevi.AeviRepo, "_table", property(lambda self: pytest.fail("used the table resource")))
+    monkeypatch.setattr(aevi.AeviRepo, "_conn", property(lambda self: pytest.fail("used the resource")))
+    assert len(other.runStatusQuery(["FAILED", "SUCCESS"], concurrent=True)) == len(RECORDS)
+    assert len(list(other.runBulkIdQuery([r["id"] for r in RECORDS]))) == len(RECORDS)
+    assert len(list(other.runPlannedQuery("status = FAILED; errorcode = 30000"))) == len(RECORDS)
+    assert other.countStatusQuery(["FAILED"])["Count"] == len(RECORDS)
+
+def test_connectionIsLazyAndShared(repo: aevi.AeviRepo):
+    other = aevi.AeviRepo(local=repo.isLocal)
+    other.setTable("prod-aevi-Transaction")
+    assert other._tableResource is None and other._clientConnection is None
+    assert other._conn is repo._conn
+    assert other._client is repo._client
+    assert aevi.AeviRepo(local=repo.isLocal, maxWorkers=2)._conn is not repo._conn
+    assert len(other.runStatusQuery(["FAILED"])) == len(RECORDS)
@@ -0,0 +1,59 @@
+import pytest
+
+from src.aggregate import Group, aggregate, requestField, topGroups
+from src.resultcache import ResultCache
+from test.test_aevirepo import RECORDS
+
+
+def test_aggregate_topLevel():
+    groups = aggregate(RECORDS, "host_device_id")
+    assert set(groups) == {"T0000561", "T00007652"}
+    group = groups["T0000561"]
+    assert group.count == 2
+    assert (group.firstTimestamp, group.lastTimestamp) == (1633824100, 1635725027)
+    assert group.amount == 18.25
+    assert groups["T00007652"].amount == 0
+
+def test_aggregate_requestField():
+    groups = aggregate(RECORDS, "currencyiso3a")
+    assert {k: g.count for k, g in groups.items()} == {"EUR": 1, None: 2}
+
+def test_aggregate_streaming():
+    records = iter(RECORDS + ["PAGE_END"])
+    groups = aggregate(records, "status", {"timestamp": "> 1634000000"})
+    assert groups["FAILED"].count == 2
+    assert groups["FAILED"].firstTimestamp == 1635721233
+
+def test_topGroups():
+    groups = {"a": Group("a"), "b": Group("b")}
+    groups["a"].add(1, 5.0)
+    for _ in range(2):
+        groups["b"].add(2, 1.0)
+    assert [g.value for g in topGroups(groups)] == ["b", "a"]
+    assert [g.value for g in topGroups(groups, 1, "amount")] == ["a"]
+    with pytest.raises(ValueError):
+        topGroups(groups, orderBy="size")
+
+def test_requestField():
+    request = '{"a": "x \\"quoted\\"", "b":12, "c": null, "dcc": "no"}'
+    assert requestField(request, "a") == 'x "quoted"'
+    assert requestField(request, "b") == 12
+    assert requestField(request, "c") is None
+    assert requestField(request, "d") is None
+    assert requestField("", "a") is None
+
+@pytest.mark.parametrize("by", ["status", "host_merchant_id", "timestamp", "currencyiso3a", "missing"])
+def test_resultCache_matchesStreaming(by):
+    expected = {k: g.asDict() for k, g in aggregate(RECORDS, by).items()}
+    assert {k: g.asDict() for k, g in ResultCache(RECORDS).aggregate(by).items()} == expected
+
+def test_resultCache_positionsAndProjection():
+    fetched = []
+    def fetch(ids):
+        fetched.extend(ids)
+        return [r for r in RECORDS if r["id"] in ids]
+    cache = ResultCache([{"id": r["id"], "status": r["status"]} for r in RECORDS], ["status"], fetch)
+    groups = cache.aggregate("status", [0, 1])
+    assert groups["FAILED"].count == 2
+    assert groups["FAILED"].amount == 18.25
+    assert len(fetched) == 2
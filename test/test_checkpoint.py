@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from src.checkpoint import STATE_SUFFIX, Checkpoint
+from test.test_aevirepo import RECORDS
+
+
+def test_savePageAndLoad(tmp_path):
+    path = str(tmp_path / "query.ndjson")
+    checkpoint = Checkpoint.create(path, "table", ["FAILED", "RETRY"], "errorcode = 30000", ["status"])
+    checkpoint.savePage("FAILED", RECORDS[:2], {"id": RECORDS[1]["id"], "status": "FAILED"})
+    checkpoint.savePage("RETRY", [], None)
+    loaded = Checkpoint.load(path)
+    assert (loaded.table, loaded.filterString, loaded.projection) == ("table", "errorcode = 30000", ["status"])
+    assert loaded.pending() == {"FAILED": {"id": RECORDS[1]["id"], "status": "FAILED"}}
+    assert not loaded.complete
+    assert list(loaded.records()) == RECORDS[:2]
+    loaded.savePage("FAILED", RECORDS[2:], None)
+    assert Checkpoint.load(path).complete
+    assert Checkpoint.load(path).statuses["FAILED"]["count"] == 3
+
+def test_loadCutsTornLine(tmp_path):
+    path = str(tmp_path / "query.jsonl")
+    checkpoint = Checkpoint.create(path, "table", ["FAILED"])
+    checkpoint.savePage("FAILED", RECORDS[:1], {"id": "x", "status": "FAILED"})
+    with open(path, "a") as fp:
+        fp.write(json.dumps(RECORDS[1])[:50])
+    assert Checkpoint.load(path).ids() == {RECORDS[0]["id"]}
+    with open(path) as fp:
+        assert fp.read().endswith("}\n")
+
+def test_stateReplacedWhole(tmp_path):
+    path = str(tmp_path / "query.ndjson")
+    Checkpoint.create(path, "table", ["FAILED"])
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["query.ndjson", "query.ndjson" + STATE_SUFFIX]
+
+def test_rejectsOtherFormats(tmp_path):
+    with pytest.raises(ValueError):
+        Checkpoint.create(str(tmp_path / "query.ndjson.gz"), "table", ["FAILED"])
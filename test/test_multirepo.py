@@ -0,0 +1,77 @@
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb2
+
+import src.aevirepo as aevi
+from src.multirepo import SOURCE_KEY, MultiRepo
+from test.test_aevirepo import RECORDS
+
+TARGETS = [("eu-west-1", "prod-aevi-Transaction"), ("us-east-1", "staging-aevi-Transaction")]
+
+
+def createTable(repo, records):
+    index = lambda name: {"IndexName": name, "KeySchema": [{"AttributeName": name, "KeyType": "HASH"}],
+                          "Projection": {"ProjectionType": "ALL"},
+                          "ProvisionedThroughput": {"ReadCapacityUnits": 1, "WriteCapacityUnits": 1}}
+    table = repo._conn.create_table(
+        TableName=repo._tableName,
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": name, "AttributeType": "S"}
+                              for name in ("id", "status", "transaction_filename_id")],
+        GlobalSecondaryIndexes=[index("status"), index("transaction_filename_id")],
+        ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5})
+    for item in records:
+        table.put_item(Item=item)
+
+@pytest.fixture(scope="module")
+def multiRepo():
+    with mock_dynamodb2():
+        multiRepo = MultiRepo(TARGETS, local=False)
+        repos = list(multiRepo.repos.values())
+        createTable(repos[0], RECORDS)
+        createTable(repos[1], [dict(r, transaction_filename_id="file0") for r in RECORDS[:2]])
+        yield multiRepo
+
+def sources(records):
+    return sorted((r[SOURCE_KEY], r["id"]) for r in records)
+
+def test_connectionPerTarget(multiRepo: MultiRepo):
+    repos = list(multiRepo.repos.values())
+    assert [r.region for r in repos] == ["eu-west-1", "us-east-1"]
+    assert repos[0]._conn is not repos[1]._conn
+    same = aevi.AeviRepo(local=False)
+    same.setTable(TARGETS[0][1])
+    assert repos[0]._conn is same._conn
+    sameRegion = MultiRepo([TARGETS[0], ("eu-west-1", "other-aevi-Transaction")], local=False)
+    assert len({id(repo._conn) for repo in sameRegion.repos.values()}) == 2
+
+def test_streamStatusQuery(multiRepo: MultiRepo):
+    res = list(multiRepo.streamStatusQuery(["FAILED"]))
+    assert sources(res) == sorted([("eu-west-1/prod-aevi-Transaction", r["id"]) for r in RECORDS] +
+                                  [("us-east-1/staging-aevi-Transaction", r["id"]) for r in RECORDS[:2]])
+    assert multiRepo.failures == {}
+    assert set(multiRepo.stats()) == {"eu-west-1/prod-aevi-Transaction", "us-east-1/staging-aevi-Transaction"}
+
+def test_idAndFilenameQueries(multiRepo: MultiRepo):
+    assert len(list(multiRepo.runIdQuery(RECORDS[2]["id"]))) == 1
+    assert len(list(multiRepo.runBulkIdQuery([r["id"] for r in RECORDS]))) == 5
+    res = list(multiRepo.runFilenamesQuery(["file0"]))
+    assert {r[SOURCE_KEY] for r in res} == {"us-east-1/staging-aevi-Transaction"}
+    assert len(list(multiRepo.runPlannedQuery("status = FAILED; errorcode = 30000"))) == 5
+
+def test_partialFailure(multiRepo: MultiRepo):
+    broken = MultiRepo(TARGETS + [("eu-west-1", "missing-aevi-Transaction")], local=False)
+    res = list(broken.streamStatusQuery(["FAILED"]))
+    assert len(res) == 5
+    assert list(broken.failures) == ["eu-west-1/missing-aevi-Transaction"]
+
+def test_everyTargetFails(multiRepo: MultiRepo):
+    broken = MultiRepo([("eu-west-1", "missing-aevi-Transaction")], local=False)
+    with pytest.raises(ClientError):
+        list(broken.streamStatusQuery(["FAILED"]))
+
+def test_parseTargets():
+    assert MultiRepo.parseTargets("eu-west-1/prod, us-east-1/staging,,dev", "eu-west-2") == \
+        [("eu-west-1", "prod"), ("us-east-1", "staging"), ("eu-west-2", "dev")]
+    with pytest.raises(ValueError):
+        MultiRepo([], local=False)
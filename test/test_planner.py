@@ -0,0 +1,40 @@
+import pytest
+
+from src.planner import planQuery
+
+BETWEEN = "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"
+
+
+def test_idUsesPrimaryKey():
+    plan = planQuery("errorcode = 30000; id = a,b; status = FAILED", 100000)
+    assert (plan.access, plan.keys, plan.filterString) == ("key", ["a", "b"], "status = FAILED; errorcode = 30000")
+    assert plan.rcu == 1.0
+    assert [p.access for p in plan.alternatives] == ["index", "scan"]
+
+def test_filenameBeatsStatus():
+    plan = planQuery("status = FAILED,RETRY; filename = f1", 100000)
+    assert (plan.index, plan.keys, plan.filterString, plan.memberships) == \
+        ("transaction_filename_id", ["f1"], "", {"status": ["FAILED", "RETRY"]})
+    assert "status in FAILED, RETRY" in plan.explain()
+
+def test_timeRangeIsKeyConditionOnlyWithSortKey():
+    plan = planQuery(f"status = FAILED; {BETWEEN}; terminalid = T1", 100000, 1024, statusRangeKey="timestamp")
+    assert plan.index == "status" and plan.timeRange == (1633824000, 1634256000)
+    assert plan.filterString == "terminalid = T1"
+    unsorted = planQuery(f"status = FAILED; {BETWEEN}; terminalid = T1", 100000, 1024)
+    assert unsorted.timeRange is None and unsorted.filterString == f"{BETWEEN}; terminalid = T1"
+    assert plan.rcu < unsorted.rcu
+
+def test_scanAsLastResort():
+    plan = planQuery("errorcode = 30000; sitereference contains x", 100000)
+    assert plan.access == "scan" and plan.alternatives == []
+    assert plan.filterString == "errorcode = 30000; sitereference contains x"
+    assert "Scan the table" in plan.explain()
+
+def test_numericTimeRange():
+    plan = planQuery("status = FAILED; between 1634000000 and 1699999999", 100000, 1024)
+    assert plan.filterString == "between 1634000000 and 1699999999"
+    timed = planQuery("status = FAILED; between 1634000000 and 1699999999; between 0 and 1650000000", 100000, 1024, "timestamp")
+    assert timed.timeRange == (1634000000, 1699999999) and timed.filterString == "between 0 and 1650000000"
+    with pytest.raises(ValueError):
+        planQuery("status = FAILED; between yesterday and now", 100000)
@@ -0,0 +1,66 @@
+import json
+import pytest
+from src.predicates import Predicate, compileFilter, filterRecords, parsePredicate, toNumber
+from test.test_aevirepo import RECORDS
+
+
+def test_parseOperators():
+    assert parsePredicate("timestamp", ">= 1634540400").op == ">="
+    assert parsePredicate("timestamp", "<1634540400").values == (1634540400,)
+    assert parsePredicate("errorcode", "!= 0").values == ("0",)
+    assert parsePredicate("version", "between 6 and 7").values == (6, 7)
+    assert parsePredicate("sitereference", "contains site").op == "contains"
+
+def test_parsePlainValue():
+    assert parsePredicate("timestamp", "1634").op == "="
+    assert parsePredicate("sitereference", "site").op == "contains"
+    assert parsePredicate("timestamp", (1, 2)).op == "between"
+
+def test_parseDates():
+    predicate = parsePredicate("timestamp", "between 2021-10-10 00:00:00 and now")
+    assert type(predicate.values[0]) == int
+
+def test_nonNumericValue():
+    with pytest.raises(ValueError):
+        parsePredicate("version", "> seven")
+
+def test_numericComparison():
+    assert not parsePredicate("timestamp", "1634").test(1634540400)
+    assert parsePredicate("mainamount", "> 9.5").test("18.25")
+    assert not parsePredicate("mainamount", "> 9.5").test("TRUNCATED")
+    assert not parsePredicate("version", "= 7").test(None)
+
+def test_matchesRequest():
+    predicate = Predicate("sitereference", "=", "siteref45678")
+    assert predicate.matches({}, {"sitereference": "siteref45678"})
+    assert not predicate.matches({"sitereference": "siteref"}, {})
+
+def test_compileFilter():
+    predicates = compileFilter({"timestamp": "> 1", "status": "FAILED"})
+    assert [(p.key, p.op) for p in predicates] == [("timestamp", ">"), ("status", "contains")]
+
+def test_toNumber():
+    assert toNumber("7") == 7
+    assert toNumber("18.25") == 18.25
+    assert toNumber("now") is None
+
+def test_filterRecords():
+    records = iter(RECORDS + ["PAGE_END"])
+    res = filterRecords(records, {"sitereference": "site", "timestamp": "> 1635721233"})
+    assert next(res) == RECORDS[0]
+    assert list(res) == []
+
+def test_missingNeverMatches():
+    assert not parsePredicate("maskedpan", "one").test(None)
+    assert not parsePredicate("status", "!= FAILED").test(None)
+    assert not parsePredicate("status", "!= FAILED").testEither(None, None)
+    assert list(filterRecords(RECORDS, {"maskedpan": "one"})) == []
+    assert list(filterRecords(RECORDS, {"maskedpan": "contains 0000"})) == [RECORDS[0]]
+
+def test_notEqualChecksBothLevels():
+    request = json.loads(RECORDS[0]["st_request"])
+    assert not parsePredicate("errorcode", "!= 30000").matches(RECORDS[0], request)
+    assert not parsePredicate("errorcode", "!= 0").matches(RECORDS[0], request)
+    assert parsePredicate("errorcode", "= 0").matches(RECORDS[0], request)
+    assert list(filterRecords(RECORDS, {"errorcode": "!= 30000"})) == []
+    assert list(filterRecords(RECORDS, {"errorcode": "!= 0"})) == RECORDS[1:]
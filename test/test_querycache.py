@@ -0,0 +1,69 @@
+import json
+import os
+from src.querycache import QueryCache, resultsSize
+from test.test_ratelimiter import FakeClock
+
+
+def records(n, tag="x"):
+    return [{"id": f"{tag}{i}", "status": "FAILED"} for i in range(n)]
+
+def test_key_normalised():
+    assert QueryCache.key("status", "status", [" FAILED", "SUCCESS"], " a = b", ["b", "a"]) == \
+        QueryCache.key("status", "status", ["FAILED", "SUCCESS", "FAILED"], "a = b", ["a", "b", "a"])
+    assert QueryCache.key("status", "status", ["FAILED"]) != QueryCache.key("count", "status", ["FAILED"])
+    assert QueryCache.key("status", "status", ["FAILED"], limit=1) != QueryCache.key("status", "status", ["FAILED"], limit=2)
+
+def test_hitsMissesAndTtl():
+    clock = FakeClock()
+    cache = QueryCache(ttl=10, clock=clock)
+    assert cache.get("a") is None
+    cache.put("a", records(3))
+    clock.now = 9
+    assert cache.get("a") == records(3)
+    clock.now = 10
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses, len(cache), cache.bytes) == (1, 2, 0, 0)
+
+def test_lruEviction():
+    size = resultsSize(records(10))
+    cache = QueryCache(maxBytes=size * 2)
+    cache.put("a", records(10, "a"))
+    cache.put("b", records(10, "b"))
+    cache.get("a")
+    cache.put("c", records(10, "c"))
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.evictions == 1 and cache.bytes <= cache.maxBytes
+
+def test_spill(tmp_path):
+    size = resultsSize(records(10))
+    cache = QueryCache(maxBytes=size, spillDir=str(tmp_path))
+    cache.put("a", records(10, "a"))
+    cache.put("b", records(10, "b"))
+    assert len(cache) == 2 and len(os.listdir(tmp_path)) == 1
+    assert cache.get("a") == records(10, "a")  # Read back, spilling b in its place
+    assert cache.get("b") == records(10, "b")
+    cache.invalidate()
+    assert len(cache) == 0 and os.listdir(tmp_path) == []
+
+def test_invalidateAndBypass():
+    cache = QueryCache()
+    cache.put("a", records(1))
+    cache.put("b", {"Count": 1})
+    cache.invalidate("a")
+    assert cache.get("a") is None and cache.get("b") == {"Count": 1}
+    cache.enabled = False
+    assert cache.get("b") is None
+    cache.put("c", records(1))
+    cache.enabled = True
+    assert cache.get("c") is None
+    assert "1 queries memoised" in cache.report()
+
+def test_keyIncludesTable():
+    assert QueryCache.key("status", "status", ["FAILED"], table="a") != QueryCache.key("status", "status", ["FAILED"], table="b")
+
+def test_putTooBig():
+    cache = QueryCache(maxBytes=500)
+    cache.put("big", [{"id": "x" * 1000}])
+    assert cache.get("big") is None
+    assert cache.bytes == 0
@@ -0,0 +1,25 @@
+from src.querystats import QueryStats
+
+
+def test_record():
+    stats = QueryStats("status FAILED")
+    stats.record({"Items": [{"id": "a"}], "Count": 1, "ScannedCount": 400, "ConsumedCapacity": {"CapacityUnits": 2.5},
+                  "ResponseMetadata": {"HTTPHeaders": {"content-length": "2048"}}}, 0.1)
+    stats.record({"Items": [], "Count": 0, "ScannedCount": 100, "ResponseMetadata": {}}, 0.3)
+    assert stats.pages == 2
+    assert (stats.count, stats.scannedCount) == (1, 500)
+    assert stats.consumedCapacity == 2.5
+    assert (stats.bytes, stats.unsizedPages) == (2048, 1)
+    assert "1 pages without a size" in stats.report()
+    assert stats.summary() == "scanned 500, returned 1, filter selectivity 0.2000%"
+    assert "max 300.0 ms" in stats.report()
+
+def test_recordBatchGet():
+    stats = QueryStats("2 ids")
+    stats.record({"Responses": {"t": [{"id": "a"}, {"id": "b"}]}, "ConsumedCapacity": [{"CapacityUnits": 1}]}, 0.1)
+    assert (stats.count, stats.scannedCount, stats.consumedCapacity) == (2, 2, 1)
+
+def test_empty():
+    stats = QueryStats("nothing")
+    assert stats.selectivity == 1.0
+    assert "Page latency" not in stats.report()
@@ -0,0 +1,48 @@
+import pytest
+from src.ratelimiter import RateLimiter
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_acquireWaitsForDebt():
+    clock = FakeClock()
+    limiter = RateLimiter(10, clock=clock, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.consume(30)
+    assert clock.now == 0
+    limiter.acquire()
+    assert 2 <= clock.now < 2.1
+    assert limiter.consumed == 30
+
+def test_burstCap():
+    clock = FakeClock()
+    limiter = RateLimiter(10, burst=5, clock=clock, sleep=clock.sleep)
+    clock.now = 100
+    limiter.consume(10)
+    limiter.acquire()
+    assert 100.5 <= clock.now < 100.6
+
+def test_throttledAndRecovery():
+    limiter = RateLimiter(100)
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.rate == 25
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.rate == 100
+    for _ in range(100):
+        limiter.throttled()
+    assert limiter.rate == 5
+
+def test_badBudget():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
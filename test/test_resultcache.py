@@ -0,0 +1,115 @@
+from src.resultcache import ResultCache
+from test.test_aevirepo import RECORDS
+
+
+def test_sequence():
+    cache = ResultCache(RECORDS)
+    assert len(cache) == len(RECORDS)
+    assert list(cache) == RECORDS
+    assert cache[-1] == RECORDS[-1]
+
+def test_requestParsedOnce():
+    cache = ResultCache(RECORDS)
+    first = cache.request(1)
+    assert first == {"sitereference": "test_site12345"}
+    assert cache.request(1) is first
+
+def test_filter_requestFieldsReadOnce(monkeypatch):
+    import src.resultcache as resultcache
+    reads = []
+    requestField = resultcache.requestField
+    monkeypatch.setattr(resultcache, "requestField", lambda request, key: reads.append(key) or requestField(request, key))
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"errormessage": "Invalid"}) == RECORDS
+    assert reads == []
+    assert cache.filter({"currencyiso3a": "EUR"}) == [RECORDS[0]]
+    assert cache.filter({"currencyiso3a": "EUR", "mainamount": "> 18"}) == [RECORDS[0]]
+    assert sorted(set(reads)) == ["currencyiso3a", "mainamount"] and len(reads) == 2 * len(RECORDS)
+    cache.append(RECORDS[0])
+    assert cache.filter({"currencyiso3a": "EUR"}) == [RECORDS[0], RECORDS[0]]
+    assert len(reads) == 2 * len(RECORDS) + 2
+
+def test_requestMissing():
+    cache = ResultCache([{"id": "a"}])
+    assert cache.request(0) == {}
+
+def test_filter_indexedContains():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"sitereference": "siteref"}) == [RECORDS[0]]
+    assert cache.filter({"host_merchant_id": "000104960034"}) == RECORDS
+    assert "sitereference" in cache._indexes
+
+def test_filter_range():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"timestamp": (1633824000, 1634256000)}) == [RECORDS[2]]
+    assert cache.filter({"created_at": (1627306534, 1627308098)}) == RECORDS[:2]
+
+def test_filter_intersection():
+    cache = ResultCache(RECORDS)
+    res = cache.filter({"status": "FAILED", "timestamp": (1635721233, 1635725027), "requestreference": "Ab8"})
+    assert res == [RECORDS[1]]
+
+def test_filter_unindexedRange():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"version": (7, 7)}) == RECORDS
+    assert cache.filter({"version": (8, 9)}) == []
+
+def test_filter_operators():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"timestamp": "> 1635721233"}) == [RECORDS[0]]
+    assert cache.filter({"timestamp": "<= 1635721233"}) == RECORDS[1:]
+    assert cache.filter({"timestamp": "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"}) == [RECORDS[2]]
+    assert cache.filter({"timestamp": "1635"}) == []
+
+def test_filter_indexedEquality():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"host_merchant_id": "= 000104960034730"}) == [RECORDS[0]]
+    assert cache.filter({"sitereference": "= siteref"}) == []
+
+def test_filter_requestNumeric():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"mainamount": ">= 18"}) == [RECORDS[0]]
+    assert cache.filter({"mainamount": "< 18"}) == []
+
+def test_columns():
+    cache = ResultCache(RECORDS)
+    assert type(cache._columns["status"]).__name__ == "_DictionaryColumn"
+    assert cache._columns["status"].values == ["FAILED"]
+    assert type(cache._columns["timestamp"]).__name__ == "_IntegerColumn"
+
+def test_missingAndMixedValues():
+    records = [{"id": "a", "version": 1}, {"id": "b", "status": "NEW"}, {"id": "c", "version": "two", "status": 3}]
+    cache = ResultCache(records)
+    assert list(cache) == records
+    assert cache[1:] == records[1:]
+
+def test_recordsAreCopies():
+    cache = ResultCache(RECORDS)
+    cache[0]["status"] = "SUCCESS"
+    assert cache[0]["status"] == "FAILED"
+
+def test_append():
+    cache = ResultCache(RECORDS[:1])
+    assert cache.filter({"timestamp": "> 0"}) == RECORDS[:1]
+    cache.append(RECORDS[1])
+    assert cache.filter({"timestamp": "> 0"}) == RECORDS[:2]
+
+def test_max():
+    cache = ResultCache(RECORDS + [{"id": "x", "timestamp": "soon"}, {"id": "y"}])
+    assert cache.max("timestamp") == max(r["timestamp"] for r in RECORDS)
+    assert cache.max("missing") is None
+
+def test_filter_notEqualAndMissing():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"status": "!= FAILED"}) == []
+    assert cache.filter({"status": "contains one"}) == []
+    assert cache.filter({"sitereference": "one"}) == []
+    assert cache.filter({"host_merchant_id": "!= 000104960034730"}) == RECORDS[1:]
+    assert "None" not in cache._index("terminalid")
+
+def test_filter_notEqualBothLevels():
+    cache = ResultCache(RECORDS)
+    assert cache.filter({"errorcode": "!= 30000"}) == []
+    assert cache.filter({"errorcode": "!= 0"}) == RECORDS[1:]
+    assert cache.filter({"terminalid": "!= T0006205"}) == []
+    assert cache.filter({"errormessage": "!= Invalid field"}) == []
@@ -0,0 +1,32 @@
+import json
+import pytest
+from src.resultfile import isStreamFormat, readRecords, writeRecords
+from src.resultcache import ResultCache
+from test.test_aevirepo import RECORDS
+
+
+@pytest.mark.parametrize("name", ["results.ndjson", "results.jsonl", "results.ndjson.gz"])
+def test_roundTrip(tmp_path, name):
+    path = tmp_path / name
+    assert writeRecords(path, iter(RECORDS[:1] + ["PAGE_END"] + RECORDS[1:])) == len(RECORDS)
+    records = readRecords(path)
+    assert next(records) == RECORDS[0]
+    assert list(records) == RECORDS[1:]
+
+def test_roundTrip_zstd(tmp_path):
+    pytest.importorskip("zstandard")
+    path = tmp_path / "results.ndjson.zst"
+    writeRecords(path, RECORDS)
+    assert list(readRecords(path)) == RECORDS
+
+def test_legacyJson(tmp_path):
+    path = tmp_path / "results.json"
+    json.dump(RECORDS, open(path, "w"))
+    assert not isStreamFormat(path)
+    assert list(readRecords(path)) == RECORDS
+
+def test_cacheFromFile(tmp_path):
+    path = tmp_path / "results.ndjson.gz"
+    writeRecords(path, RECORDS)
+    cache = ResultCache(readRecords(path))
+    assert cache.filter({"sitereference": "siteref"}) == [RECORDS[0]]
@@ -0,0 +1,56 @@
+import pytest
+from src.resultcache import ResultCache
+from src.resultstore import ResultStore
+from test.test_aevirepo import RECORDS
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore.create(str(tmp_path / "results.db"))
+    store.insert(RECORDS + ["PAGE_END"], batchSize=2)
+    yield store
+    store.close()
+
+def test_sequence(store: ResultStore):
+    assert len(store) == len(RECORDS)
+    assert list(store) == RECORDS
+    assert store[-1] == RECORDS[-1]
+    with pytest.raises(IndexError):
+        store[len(RECORDS)]
+
+def test_reopen(store: ResultStore):
+    reopened = ResultStore.load(store.path)
+    assert list(reopened) == RECORDS
+
+def test_createReplaces(store: ResultStore):
+    replaced = ResultStore.create(store.path)
+    assert len(replaced) == 0
+    replaced.insert(RECORDS[:1])
+    assert list(ResultStore.load(store.path)) == RECORDS[:1]
+
+def test_loadMissing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ResultStore.load(str(tmp_path / "missing.db"))
+
+def test_filter_columns(store: ResultStore):
+    assert store.filter({"status": "= FAILED", "timestamp": "> 1635721233"}) == [RECORDS[0]]
+    assert store.filter({"timestamp": "between 2021-10-10 00:00:00 and 2021-10-15 00:00:00"}) == [RECORDS[2]]
+    assert store.filter({"errorcode": "= 0"}) == [RECORDS[0]]
+
+def test_filter_requestColumns(store: ResultStore):
+    assert store.filter({"sitereference": "site"}) == RECORDS[:2]
+    assert store.filter({"mainamount": ">= 18"}) == [RECORDS[0]]
+
+def test_filter_extracted(store: ResultStore):
+    assert store.filter({"requestreference": "Ab5"}) == [RECORDS[0], RECORDS[2]]
+    assert store.filter({"currencyiso3a": "= EUR"}) == [RECORDS[0]]
+    assert store.filter({"send_attempts": "< 1"}) == []
+
+def test_filter_empty(store: ResultStore):
+    assert store.filter({}) == RECORDS
+
+@pytest.mark.parametrize("filterDict", [{"status": "!= FAILED"}, {"status": "contains one"}, {"sitereference": "one"},
+                                        {"maskedpan": "one"}, {"host_merchant_id": "!= 000104960034730"},
+                                        {"errorcode": "!= 30000"}, {"errorcode": "!= 0"}, {"terminalid": "!= T0006205"}])
+def test_filter_agreesWithCache(store: ResultStore, filterDict):
+    assert store.filter(filterDict) == ResultCache(RECORDS).filter(filterDict)
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+QtCore = pytest.importorskip("PySide6.QtCore")
+
+from src.view.queryworker import PAGE_SIZE, QueryWorker
+from src.view.resultsmodel import FETCH_SIZE, ResultsModel
+from test.test_aevirepo import RECORDS
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+def records(n):
+    return [dict(RECORDS[i % len(RECORDS)], id=str(i)) for i in range(n)]
+
+def runWorker(app, worker):
+    """Run a worker to the end and deliver its signals, returning (pages, finished, failed)."""
+    pages, finished, failed = [], [], []
+    worker.page.connect(pages.append)
+    worker.finished.connect(lambda count, cancelled: finished.append((count, cancelled)))
+    worker.failed.connect(failed.append)
+    worker.start()
+    for _ in range(1000):  # The thread quits on a queued call, as it would in the window's event loop
+        app.processEvents()
+        if worker.thread.wait(10):
+            break
+    app.processEvents()
+    assert worker.thread.isFinished()
+    return pages, finished, failed
+
+
+def test_model_addRecords(app):
+    model = ResultsModel()
+    model.addRecords(RECORDS[:1] + ["PAGE_END"] + RECORDS[1:])
+    assert (model.rowCount(), len(model)) == (len(RECORDS), len(RECORDS))
+    assert not model.canFetchMore()
+    assert model.headerData(0, QtCore.Qt.Horizontal) == "id"
+    assert model.data(model.index(0, 0)) == RECORDS[0]["id"]
+    assert model.data(model.index(0, 1), QtCore.Qt.EditRole) is None
+
+def test_model_fetchMore(app):
+    model = ResultsModel()
+    model.addRecords(records(FETCH_SIZE - 1))
+    model.addRecords(records(FETCH_SIZE + 10))
+    assert model.rowCount() == 2 * FETCH_SIZE - 1
+    model.addRecords(records(5))
+    assert model.rowCount() == 2 * FETCH_SIZE - 1
+    assert model.canFetchMore()
+    model.fetchMore()
+    assert model.rowCount() == len(model) == 2 * FETCH_SIZE + 14
+    assert not model.canFetchMore()
+    model.fetchMore()
+    assert model.rowCount() == 2 * FETCH_SIZE + 14
+
+def test_model_clear(app):
+    model = ResultsModel()
+    model.addRecords(RECORDS)
+    model.clear()
+    assert (model.rowCount(), len(model)) == (0, 0)
+    assert not model.canFetchMore()
+
+def test_worker_pages(app):
+    done = []
+    worker = QueryWorker(lambda: iter(records(PAGE_SIZE + 1) + ["PAGE_END"]), done.append)
+    pages, finished, failed = runWorker(app, worker)
+    assert [len(p) for p in pages] == [PAGE_SIZE, 1]
+    assert finished == [(PAGE_SIZE + 1, False)] and not failed
+    assert done == [[r for page in pages for r in page]]
+
+def test_worker_cancel(app):
+    closed = threading.Event()
+    worker = None
+
+    def query():
+        try:
+            for i, record in enumerate(records(3 * PAGE_SIZE)):
+                if i == PAGE_SIZE + 1:
+                    worker.cancel()
+                yield record
+        finally:
+            closed.set()
+
+    done = []
+    worker = QueryWorker(query, done.append)
+    pages, finished, failed = runWorker(app, worker)
+    assert [len(p) for p in pages] == [PAGE_SIZE]
+    assert finished == [(PAGE_SIZE, True)] and not failed
+    assert closed.is_set() and not done
+
+def test_worker_failed(app):
+    def query():
+        yield RECORDS[0]
+        raise ValueError("Unreadable time range")
+
+    pages, finished, failed = runWorker(app, QueryWorker(query))
+    assert failed == ["Unreadable time range"] and not finished